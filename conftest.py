@@ -0,0 +1 @@
+# Lets pytest import chess.py and the engine package from the repository root
@@ -0,0 +1 @@
+# Pure Python rules core shared by the GUI (chess.py) and the CLI (main.py)
@@ -0,0 +1,237 @@
+import argparse
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+
+from engine.fen import START_FEN, position_from_fen
+from engine.move import CAPTURE, move_to_uci
+from engine.movegen import move_from_san
+from engine.pgn import RESULTS, read_games, san_moves
+
+# Append-only archive of games as 16-bit engine.move ints, in two files:
+#
+#   NAME         every game one after the other: a four byte header (plies
+#                as uint16, result as an index into RESULTS, FEN length),
+#                the start FEN when it is not the usual one, padded to an
+#                even length, then the moves as uint16
+#   NAME.idx     the offset of each game in NAME as uint64
+#
+# Everything is little-endian. Offsets are held back until the games they
+# point to are flushed and synced, so the index never points past the data
+# even if the writer or the machine dies half way; an offset cut short is
+# dropped by the reader and the next writer. A typical 80 ply game takes
+# 164 bytes plus 8 in the index.
+
+HEADER = struct.Struct('<HBB')
+OFFSET_BYTES = 8
+MAX_PLIES = 0xFFFF
+MAX_FEN = 0xFF
+# Offsets a writer holds back before it syncs the data and writes them
+PENDING_OFFSETS = 1024
+
+
+def _native(buffer, typecode):
+    # A memoryview of the little-endian numbers in buffer, the buffer itself
+    # on little-endian machines and a byteswapped copy elsewhere
+    if sys.byteorder == 'little':
+        return memoryview(buffer).cast(typecode)
+    numbers = array(typecode, bytes(buffer))
+    numbers.byteswap()
+    return memoryview(numbers)
+
+
+class ArchiveWriter:
+    def __init__(self, path):
+        self.data = open(path, 'ab')
+        self.index = open(path + '.idx', 'ab')
+        self.offset = self.data.seek(0, os.SEEK_END)
+        # Drop an offset a dead writer only got part of the way through
+        size = self.index.seek(0, os.SEEK_END)
+        if size % OFFSET_BYTES:
+            self.index.truncate(size - size % OFFSET_BYTES)
+        # Offsets of the games written since the last flush
+        self.pending = bytearray()
+
+    def append(self, moves, result='*', fen=None):
+        # moves is any sequence of engine.move ints
+        moves = moves if isinstance(moves, array) and moves.typecode == 'H' else array('H', moves)
+        if len(moves) > MAX_PLIES:
+            raise ValueError(f"{len(moves)} plies do not fit in a game record")
+        fen = b'' if fen is None or fen == START_FEN else fen.encode()
+        if len(fen) > MAX_FEN:
+            raise ValueError(f"FEN too long for a game record: {fen!r}")
+        if len(fen) % 2:
+            fen += b' '
+        if sys.byteorder != 'little':
+            moves = array('H', moves)
+            moves.byteswap()
+        record = HEADER.pack(len(moves), RESULTS.index(result), len(fen)) + fen + moves.tobytes()
+        self.data.write(record)
+        self.pending += self.offset.to_bytes(OFFSET_BYTES, 'little')
+        self.offset += len(record)
+        if len(self.pending) >= PENDING_OFFSETS * OFFSET_BYTES:
+            self.flush()
+
+    def flush(self):
+        # The games reach the disk before the offsets pointing at them
+        self.data.flush()
+        if self.pending:
+            os.fsync(self.data.fileno())
+            self.index.write(self.pending)
+            self.pending.clear()
+        self.index.flush()
+
+    def close(self):
+        self.flush()
+        self.data.close()
+        self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ArchiveReader:
+    # Maps both files, so game N is found in the index without reading
+    # anything before it and its moves are a view straight into the mapping.
+    # Views taken from the reader must be released before it is closed.
+    # Big-endian machines get byteswapped copies instead, the writer swaps
+    # the same way on the way out.
+    def __init__(self, path):
+        self.files = []
+        self.maps = []
+        data = self._map(path)
+        index = self._map(path + '.idx')
+        self.data = memoryview(data) if data is not None else memoryview(b'')
+        index = memoryview(index) if index is not None else memoryview(b'')
+        # Whole offsets only, the last may have been cut short by a crash
+        self.offsets = _native(index[:len(index) - len(index) % OFFSET_BYTES], 'Q')
+        index.release()
+
+    def _map(self, path):
+        file = open(path, 'rb')
+        self.files.append(file)
+        if os.fstat(file.fileno()).st_size == 0:
+            return None
+        mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.maps.append(mapping)
+        return mapping
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def header(self, number):
+        # (plies, result, start FEN) of game number, counted from 0
+        offset = self.offsets[number]
+        plies, result, fen_length = HEADER.unpack_from(self.data, offset)
+        fen = bytes(self.data[offset + HEADER.size:offset + HEADER.size + fen_length]).decode().strip()
+        return plies, RESULTS[result], fen or START_FEN
+
+    def moves(self, number):
+        # The moves of game number as a memoryview of uint16, no copy made
+        # on little-endian machines
+        offset = self.offsets[number]
+        plies, _, fen_length = HEADER.unpack_from(self.data, offset)
+        start = offset + HEADER.size + fen_length
+        return _native(self.data[start:start + plies * 2], 'H')
+
+    def __getitem__(self, number):
+        return self.moves(number)
+
+    def __iter__(self):
+        for number in range(len(self)):
+            yield self.moves(number)
+
+    def close(self):
+        self.offsets.release()
+        self.data.release()
+        for mapping in self.maps:
+            mapping.close()
+        for file in self.files:
+            file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def import_pgn(stream, writer):
+    # Append the games of a PGN stream, each up to its first illegal move.
+    # Returns the number of games written.
+    games = 0
+    for tags, movetext in read_games(stream):
+        fen = tags.get('FEN', START_FEN)
+        position = position_from_fen(fen)
+        moves = array('H')
+        for san in san_moves(movetext):
+            move = move_from_san(position, san)
+            if move is None:
+                break
+            position.make(move)
+            moves.append(move)
+        result = tags.get('Result', '*')
+        writer.append(moves, result if result in RESULTS else '*', fen)
+        games += 1
+    return games
+
+
+def main(argv=None):
+    # python -m engine.archive import ARCHIVE [pgn ...]
+    # python -m engine.archive scan ARCHIVE
+    # python -m engine.archive show ARCHIVE N
+    parser = argparse.ArgumentParser(description="Build and read binary game archives")
+    commands = parser.add_subparsers(dest='command', required=True)
+    command = commands.add_parser('import', help="append PGN games to an archive")
+    command.add_argument('archive')
+    command.add_argument('files', nargs='*', help="PGN files, stdin when none or -")
+    command = commands.add_parser('scan', help="read every move of an archive and time it")
+    command.add_argument('archive')
+    command = commands.add_parser('show', help="print one game's moves")
+    command.add_argument('archive')
+    command.add_argument('number', type=int, help="game number, from 1")
+    args = parser.parse_args(argv)
+
+    if args.command == 'import':
+        start = time.perf_counter()
+        games = 0
+        with ArchiveWriter(args.archive) as writer:
+            for name in args.files or ['-']:
+                stream = sys.stdin if name == '-' else open(name, encoding='utf-8', errors='replace')
+                with stream:
+                    games += import_pgn(stream, writer)
+        print(f"{games} games added in {time.perf_counter() - start:.2f} s")
+    elif args.command == 'scan':
+        with ArchiveReader(args.archive) as reader:
+            start = time.perf_counter()
+            plies = captures = 0
+            for moves in reader:
+                plies += len(moves)
+                for move in moves:
+                    if move >> 12 & CAPTURE:
+                        captures += 1
+                moves.release()
+            elapsed = time.perf_counter() - start
+            size = os.path.getsize(args.archive) + os.path.getsize(args.archive + '.idx')
+            games = len(reader)
+            print(f"{games} games, {plies} moves ({captures} captures), {size} bytes, "
+                  f"{size / games if games else 0:.1f} bytes/game, {elapsed:.3f} s, "
+                  f"{games / elapsed if elapsed > 0 else 0:.0f} games/s")
+    else:
+        with ArchiveReader(args.archive) as reader:
+            plies, result, fen = reader.header(args.number - 1)
+            moves = reader.moves(args.number - 1)
+            print(f"[FEN \"{fen}\"]\n[Result \"{result}\"]")
+            print(' '.join(move_to_uci(move) for move in moves), result)
+            moves.release()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+# Squares are numbered row * 8 + col, which matches the (row, col) tuples used
+# by the list boards: a1 = 0, h1 = 7, a8 = 56, h8 = 63. A bitboard is a plain
+# Python int with bit n set when square n is in the set.
+
+WHITE = 0
+BLACK = 1
+COLOURS = ('WHITE', 'BLACK')
+COLOUR_INDEX = {'WHITE': WHITE, 'BLACK': BLACK}
+
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+PIECE_TYPES = 'PNBRQK'
+
+FULL = 0xFFFFFFFFFFFFFFFF
+FILE_NAMES = 'abcdefgh'
+
+
+def square(row, col):
+    return row * 8 + col
+
+
+def square_name(sq):
+    return FILE_NAMES[sq & 7] + str((sq >> 3) + 1)
+
+
+def parse_square(name):
+    return square(int(name[1]) - 1, FILE_NAMES.index(name[0]))
+
+
+def squares(bb):
+    # Yield the set squares from low to high
+    while bb:
+        low = bb & -bb
+        yield low.bit_length() - 1
+        bb ^= low
+
+
+def popcount(bb):
+    return bin(bb).count('1')
+
+
+def _step_targets(steps):
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        targets = 0
+        for d_row, d_col in steps:
+            r, c = row + d_row, col + d_col
+            if 0 <= r <= 7 and 0 <= c <= 7:
+                targets |= 1 << square(r, c)
+        table.append(targets)
+    return table
+
+
+KNIGHT_ATTACKS = _step_targets([(2, 1), (1, 2), (-1, 2), (-2, 1), (-2, -1), (-1, -2), (1, -2), (2, -1)])
+KING_ATTACKS = _step_targets([(1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1)])
+# PAWN_ATTACKS[colour][sq] are the squares a pawn of that colour on sq attacks
+PAWN_ATTACKS = (_step_targets([(1, -1), (1, 1)]), _step_targets([(-1, -1), (-1, 1)]))
+
+
+def _ray_bits(sq, d_row, d_col):
+    # Single bit masks of the squares along a direction, nearest first
+    return [1 << target for target in _ray_squares(sq, d_row, d_col)]
+
+
+def _ray_squares(sq, d_row, d_col):
+    row, col = divmod(sq, 8)
+    targets = []
+    row, col = row + d_row, col + d_col
+    while 0 <= row <= 7 and 0 <= col <= 7:
+        targets.append(square(row, col))
+        row, col = row + d_row, col + d_col
+    return targets
+
+
+def _walk(bits, occupied):
+    # Attacks along one ray, up to and including the first blocker
+    targets = 0
+    for bit in bits:
+        targets |= bit
+        if occupied & bit:
+            break
+    return targets
+
+
+def _line_tables(directions):
+    # For every square and line (a pair of opposite directions) store the
+    # blocker mask and a dict from masked occupancy to attacked squares.
+    # Edge squares never block anything further, so they are left out of the
+    # mask which keeps every dict at 64 entries or fewer.
+    masks = []
+    tables = []
+    for sq in range(64):
+        sq_masks = []
+        sq_tables = []
+        for line in directions:
+            rays = [_ray_bits(sq, d_row, d_col) for d_row, d_col in line]
+            # drop the last square of each ray
+            mask = sum(sum(ray[:-1]) for ray in rays)
+            attacks = {}
+            subset = 0
+            while True:
+                attacks[subset] = _walk(rays[0], subset) | _walk(rays[1], subset)
+                subset = (subset - mask) & mask
+                if not subset:
+                    break
+            sq_masks.append(mask)
+            sq_tables.append(attacks)
+        masks.append(tuple(sq_masks))
+        tables.append(tuple(sq_tables))
+    return masks, tables
+
+
+_ROOK_MASKS, _ROOK_TABLES = _line_tables((((1, 0), (-1, 0)), ((0, 1), (0, -1))))
+_BISHOP_MASKS, _BISHOP_TABLES = _line_tables((((1, 1), (-1, -1)), ((1, -1), (-1, 1))))
+
+
+def rook_attacks(sq, occupied):
+    file_mask, rank_mask = _ROOK_MASKS[sq]
+    file_table, rank_table = _ROOK_TABLES[sq]
+    return file_table[occupied & file_mask] | rank_table[occupied & rank_mask]
+
+
+def bishop_attacks(sq, occupied):
+    diag_mask, anti_mask = _BISHOP_MASKS[sq]
+    diag_table, anti_table = _BISHOP_TABLES[sq]
+    return diag_table[occupied & diag_mask] | anti_table[occupied & anti_mask]
+
+
+def queen_attacks(sq, occupied):
+    return rook_attacks(sq, occupied) | bishop_attacks(sq, occupied)
+
+
+# Squares strictly between two squares on a common line, 0 otherwise
+BETWEEN = [[0] * 64 for _ in range(64)]
+for _a in range(64):
+    for _d_row, _d_col in ((1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (-1, -1), (1, -1), (-1, 1)):
+        _between = 0
+        for _b in _ray_squares(_a, _d_row, _d_col):
+            BETWEEN[_a][_b] = _between
+            _between |= 1 << _b
+del _a, _b, _d_row, _d_col, _between
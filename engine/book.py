@@ -0,0 +1,226 @@
+import argparse
+import mmap
+import os
+import random
+import re
+import struct
+import sys
+import time
+from collections import defaultdict
+
+from engine.archive import ArchiveReader
+from engine.bitboard import WHITE, PAWN, PAWN_ATTACKS
+from engine.fen import START_FEN, position_from_fen
+from engine.move import KING_CASTLE, QUEEN_CASTLE, move_from, move_to, move_flag, promotion_type, move_to_uci
+from engine.movegen import legal_moves, move_from_san
+from engine.pgn import read_games, san_moves
+
+# Opening books in the Polyglot file format: 16 byte big-endian entries of
+# key (uint64), move (uint16), weight (uint16) and learn (uint32), sorted by
+# key. A book is only ever mapped and binary searched, never loaded.
+#
+# Polyglot moves keep the to square in bits 0-5, the from square in bits 6-11
+# and the promoted piece (1 knight to 4 queen) in bits 12-14, so castling is
+# written as the king taking its own rook.
+#
+# Keys are the engine's Zobrist keys, which are built from Polyglot's own
+# Random64 table, so books from other programs work as they are and books
+# written here work in them. A book keyed with some other table can still be
+# read by passing it as randoms: load_randoms reads it from any text holding
+# the 781 numbers in hex.
+
+ENTRY = struct.Struct('>QHHI')
+KEY = struct.Struct('>Q')
+RANDOMS = 781
+# Weights a game's result gives the moves of the side that won, drew or lost
+RESULT_WEIGHTS = {'1-0': (2, 0), '0-1': (0, 2), '1/2-1/2': (1, 1)}
+
+
+def load_randoms(path):
+    with open(path) as file:
+        randoms = [int(number, 16) for number in re.findall(r'0x([0-9A-Fa-f]{16})', file.read())]
+    if len(randoms) < RANDOMS:
+        raise ValueError(f"{path} holds {len(randoms)} 64-bit numbers, a Polyglot key table has {RANDOMS}")
+    return randoms[:RANDOMS]
+
+
+def book_key(position, randoms=None):
+    if randoms is None:
+        return position.key
+    key = 0
+    for sq, code in enumerate(position.squares):
+        if code is not None:
+            colour, piece_type = divmod(code, 6)
+            # Polyglot counts black pawn, white pawn, black knight, ...
+            key ^= randoms[64 * (piece_type * 2 + (colour == WHITE)) + sq]
+    for bit in range(4):
+        if position.castling >> bit & 1:
+            key ^= randoms[768 + bit]
+    ep_square = position.ep_square
+    side = position.side
+    if ep_square is not None and PAWN_ATTACKS[side ^ 1][ep_square] & position.pieces[side * 6 + PAWN]:
+        key ^= randoms[772 + (ep_square & 7)]
+    if side == WHITE:
+        key ^= randoms[780]
+    return key
+
+
+def to_polyglot(move):
+    from_sq, to_sq = move_from(move), move_to(move)
+    flag = move_flag(move)
+    if flag == KING_CASTLE:
+        to_sq = from_sq + 3
+    elif flag == QUEEN_CASTLE:
+        to_sq = from_sq - 4
+    return to_sq | from_sq << 6 | (promotion_type(move) or 0) << 12
+
+
+class OpeningBook:
+    def __init__(self, path, randoms=None):
+        self.randoms = randoms
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self.entries = size // ENTRY.size
+
+    def __len__(self):
+        return self.entries
+
+    def first(self, key):
+        # Index of the first entry with the key, or of the first one past it
+        low, high = 0, self.entries
+        unpack = KEY.unpack_from
+        book = self.map
+        while low < high:
+            middle = (low + high) // 2
+            if unpack(book, middle * ENTRY.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def entries_for(self, key):
+        # (Polyglot move, weight, learn) of every entry for the key
+        found = []
+        index = self.first(key)
+        while index < self.entries:
+            entry_key, move, weight, learn = ENTRY.unpack_from(self.map, index * ENTRY.size)
+            if entry_key != key:
+                break
+            found.append((move, weight, learn))
+            index += 1
+        return found
+
+    def moves(self, position):
+        # [(move, weight)] of the book moves legal in the position
+        found = self.entries_for(book_key(position, self.randoms))
+        if not found:
+            return []
+        legal = {to_polyglot(move): move for move in legal_moves(position)}
+        return [(legal[move], weight) for move, weight, _ in found if move in legal]
+
+    def choose(self, position, rng=random):
+        # A book move picked in proportion to its weight, None out of book
+        moves = [(move, weight) for move, weight in self.moves(position) if weight]
+        if not moves:
+            return None
+        return rng.choices([move for move, _ in moves], [weight for _, weight in moves])[0]
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_book(path, weights):
+    # weights maps key -> {Polyglot move: weight}. Weights are scaled down
+    # per position to fit 16 bits.
+    with open(path, 'wb') as file:
+        for key in sorted(weights):
+            moves = weights[key]
+            top = max(moves.values())
+            scale = 0xFFFF / top if top > 0xFFFF else 1
+            for move, weight in sorted(moves.items(), key=lambda item: -item[1]):
+                file.write(ENTRY.pack(key, move, int(weight * scale), 0))
+    return sum(len(moves) for moves in weights.values())
+
+
+def add_game(weights, moves, result, fen, plies, randoms=None):
+    # Count the first plies of a game's moves, weighted by how it ended
+    position = position_from_fen(fen)
+    win = RESULT_WEIGHTS.get(result, (1, 1))
+    for move in moves[:plies]:
+        weights[book_key(position, randoms)][to_polyglot(move)] += win[position.side]
+        position.make(move)
+
+
+def main(argv=None):
+    # python -m engine.book build BOOK [--plies N] [--keys FILE] games.pgn|games.arc ...
+    # python -m engine.book probe BOOK [--keys FILE] [fen]
+    parser = argparse.ArgumentParser(description="Build and probe Polyglot opening books")
+    commands = parser.add_subparsers(dest='command', required=True)
+    command = commands.add_parser('build', help="make a book from PGN files or game archives")
+    command.add_argument('book')
+    command.add_argument('files', nargs='+', help="PGN files, or archives made by engine.archive (.arc)")
+    command.add_argument('--plies', type=int, default=20, help="moves taken from the start of each game")
+    command.add_argument('--keys', help="file with a key table to use instead of Polyglot's Random64")
+    command = commands.add_parser('probe', help="list the book moves of a position")
+    command.add_argument('book')
+    command.add_argument('fen', nargs='*', help="the start position by default")
+    command.add_argument('--keys', help="file with the key table the book was made with, when not Random64")
+    args = parser.parse_args(argv)
+    randoms = load_randoms(args.keys) if args.keys else None
+
+    if args.command == 'build':
+        start = time.perf_counter()
+        weights = defaultdict(lambda: defaultdict(int))
+        games = 0
+        for name in args.files:
+            if name.endswith('.arc'):
+                with ArchiveReader(name) as reader:
+                    for number in range(len(reader)):
+                        _, result, fen = reader.header(number)
+                        moves = reader.moves(number)
+                        add_game(weights, moves, result, fen, args.plies, randoms)
+                        moves.release()
+                        games += 1
+                continue
+            with open(name, encoding='utf-8', errors='replace') as stream:
+                for tags, movetext in read_games(stream):
+                    fen = tags.get('FEN', START_FEN)
+                    position = position_from_fen(fen)
+                    moves = []
+                    for san in san_moves(movetext):
+                        move = move_from_san(position, san)
+                        if move is None or len(moves) == args.plies:
+                            break
+                        position.make(move)
+                        moves.append(move)
+                    add_game(weights, moves, tags.get('Result', '*'), fen, args.plies, randoms)
+                    games += 1
+        entries = write_book(args.book, weights)
+        print(f"{games} games, {len(weights)} positions, {entries} entries "
+              f"in {time.perf_counter() - start:.2f} s")
+    else:
+        position = position_from_fen(' '.join(args.fen) if args.fen else START_FEN)
+        start = time.perf_counter()
+        with OpeningBook(args.book, randoms) as book:
+            opened = time.perf_counter()
+            moves = book.moves(position)
+            probed = time.perf_counter()
+            total = sum(weight for _, weight in moves)
+            for move, weight in sorted(moves, key=lambda item: -item[1]):
+                print(f"{move_to_uci(move):6} {weight:>6} {weight / total if total else 0:6.1%}")
+            print(f"{len(book)} entries, opened in {(opened - start) * 1e6:.0f} us, "
+                  f"probed in {(probed - opened) * 1e6:.0f} us")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
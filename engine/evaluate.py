@@ -0,0 +1,135 @@
+from engine.bitboard import WHITE, BLACK, KNIGHT, BISHOP, ROOK, QUEEN, KING, popcount
+
+PIECE_VALUES = (100, 320, 330, 500, 900, 0)
+
+# Piece-square tables from white's point of view, rank 8 first so they read
+# like a board diagram
+PAWN_TABLE = (
+     0,   0,   0,   0,   0,   0,   0,   0,
+    50,  50,  50,  50,  50,  50,  50,  50,
+    10,  10,  20,  30,  30,  20,  10,  10,
+     5,   5,  10,  25,  25,  10,   5,   5,
+     0,   0,   0,  20,  20,   0,   0,   0,
+     5,  -5, -10,   0,   0, -10,  -5,   5,
+     5,  10,  10, -20, -20,  10,  10,   5,
+     0,   0,   0,   0,   0,   0,   0,   0,
+)
+KNIGHT_TABLE = (
+   -50, -40, -30, -30, -30, -30, -40, -50,
+   -40, -20,   0,   0,   0,   0, -20, -40,
+   -30,   0,  10,  15,  15,  10,   0, -30,
+   -30,   5,  15,  20,  20,  15,   5, -30,
+   -30,   0,  15,  20,  20,  15,   0, -30,
+   -30,   5,  10,  15,  15,  10,   5, -30,
+   -40, -20,   0,   5,   5,   0, -20, -40,
+   -50, -40, -30, -30, -30, -30, -40, -50,
+)
+BISHOP_TABLE = (
+   -20, -10, -10, -10, -10, -10, -10, -20,
+   -10,   0,   0,   0,   0,   0,   0, -10,
+   -10,   0,   5,  10,  10,   5,   0, -10,
+   -10,   5,   5,  10,  10,   5,   5, -10,
+   -10,   0,  10,  10,  10,  10,   0, -10,
+   -10,  10,  10,  10,  10,  10,  10, -10,
+   -10,   5,   0,   0,   0,   0,   5, -10,
+   -20, -10, -10, -10, -10, -10, -10, -20,
+)
+ROOK_TABLE = (
+     0,   0,   0,   0,   0,   0,   0,   0,
+     5,  10,  10,  10,  10,  10,  10,   5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+     0,   0,   0,   5,   5,   0,   0,   0,
+)
+QUEEN_TABLE = (
+   -20, -10, -10,  -5,  -5, -10, -10, -20,
+   -10,   0,   0,   0,   0,   0,   0, -10,
+   -10,   0,   5,   5,   5,   5,   0, -10,
+    -5,   0,   5,   5,   5,   5,   0,  -5,
+     0,   0,   5,   5,   5,   5,   0,  -5,
+   -10,   5,   5,   5,   5,   5,   0, -10,
+   -10,   0,   5,   0,   0,   0,   0, -10,
+   -20, -10, -10,  -5,  -5, -10, -10, -20,
+)
+KING_MIDDLE_TABLE = (
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -20, -30, -30, -40, -40, -30, -30, -20,
+   -10, -20, -20, -20, -20, -20, -20, -10,
+    20,  20,   0,   0,   0,   0,  20,  20,
+    20,  30,  10,   0,   0,  10,  30,  20,
+)
+KING_END_TABLE = (
+   -50, -40, -30, -20, -20, -30, -40, -50,
+   -30, -20, -10,   0,   0, -10, -20, -30,
+   -30, -10,  20,  30,  30,  20, -10, -30,
+   -30, -10,  30,  40,  40,  30, -10, -30,
+   -30, -10,  30,  40,  40,  30, -10, -30,
+   -30, -10,  20,  30,  30,  20, -10, -30,
+   -30, -30,   0,   0,   0,   0, -30, -30,
+   -50, -30, -30, -30, -30, -30, -30, -50,
+)
+
+
+def _square_scores(table, value):
+    # Material plus table bonus for every square, for white and black codes.
+    # Scores are from white's side, so black entries are mirrored and negated.
+    white = [value + table[(7 - (sq >> 3)) * 8 + (sq & 7)] for sq in range(64)]
+    black = [-(value + table[sq]) for sq in range(64)]
+    return white, black
+
+
+_TABLES = (PAWN_TABLE, KNIGHT_TABLE, BISHOP_TABLE, ROOK_TABLE, QUEEN_TABLE, KING_MIDDLE_TABLE)
+_white, _black = zip(*(_square_scores(table, value) for table, value in zip(_TABLES, PIECE_VALUES)))
+# SQUARE_SCORES[code][sq], the king entries use the middle game table
+SQUARE_SCORES = list(_white) + list(_black)
+KING_END_SCORES = _square_scores(KING_END_TABLE, 0)
+del _white, _black
+
+# Phase runs from 24 with all pieces on the board down to 0
+PHASE_WEIGHTS = (0, 1, 1, 2, 4, 0)
+MAX_PHASE = 24
+
+
+def evaluate(position):
+    # Static score in centipawns from the side to move's point of view
+    squares = position.squares
+    occupied = position.occupied[0] | position.occupied[1]
+    score = 0
+    while occupied:
+        low = occupied & -occupied
+        sq = low.bit_length() - 1
+        occupied ^= low
+        score += SQUARE_SCORES[squares[sq]][sq]
+
+    pieces = position.pieces
+    phase = 0
+    for piece_type in (KNIGHT, BISHOP, ROOK, QUEEN):
+        phase += PHASE_WEIGHTS[piece_type] * popcount(pieces[piece_type] | pieces[6 + piece_type])
+    phase = min(phase, MAX_PHASE)
+    if phase < MAX_PHASE:
+        # Slide the kings from the middle game table to the end game one
+        white_king = position.king_square(WHITE)
+        black_king = position.king_square(BLACK)
+        king_middle = king_end = 0
+        if white_king is not None:
+            king_middle += SQUARE_SCORES[KING][white_king]
+            king_end += KING_END_SCORES[0][white_king]
+        if black_king is not None:
+            king_middle += SQUARE_SCORES[6 + KING][black_king]
+            king_end += KING_END_SCORES[1][black_king]
+        score += (king_end - king_middle) * (MAX_PHASE - phase) // MAX_PHASE
+    return score if position.side == WHITE else -score
+
+
+def only_pawns(position, colour):
+    # True when the side has nothing but king and pawns, where zugzwang is
+    # common and a null move cannot be trusted
+    pieces = position.pieces
+    base = colour * 6
+    return not (pieces[base + KNIGHT] | pieces[base + BISHOP] | pieces[base + ROOK] | pieces[base + QUEEN])
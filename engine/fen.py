@@ -0,0 +1,133 @@
+from engine.bitboard import (
+    WHITE, BLACK, PAWN, ROOK, KING, COLOURS, PIECE_TYPES, popcount, square, square_name, parse_square,
+)
+from engine.position import Position, CASTLING, WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE
+
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+
+CASTLING_LETTERS = {'K': WHITE_KINGSIDE, 'Q': WHITE_QUEENSIDE, 'k': BLACK_KINGSIDE, 'q': BLACK_QUEENSIDE}
+
+
+def position_from_fen(fen):
+    # ValueError for anything that would leave the move generator with a
+    # position it cannot play: a malformed board, a side without exactly one
+    # king, or an en passant square with no pawn that could just have
+    # passed it
+    fields = fen.split()
+    if len(fields) < 4:
+        raise ValueError(f"FEN needs at least 4 fields: {fen}")
+    ranks = fields[0].split('/')
+    if len(ranks) != 8:
+        raise ValueError(f"FEN board needs 8 ranks: {fields[0]}")
+    position = Position()
+    row = 7
+    for rank in ranks:
+        col = 0
+        for char in rank:
+            if char in '12345678':
+                col += int(char)
+                continue
+            if char.upper() not in PIECE_TYPES:
+                raise ValueError(f"unknown piece {char!r} in FEN: {fields[0]}")
+            if col < 8:
+                colour = WHITE if char.isupper() else BLACK
+                position.put(square(row, col), colour * 6 + PIECE_TYPES.index(char.upper()))
+            col += 1
+        if col != 8:
+            raise ValueError(f"FEN rank {8 - row} is not 8 squares long: {rank}")
+        row -= 1
+    for colour in (WHITE, BLACK):
+        if popcount(position.pieces[colour * 6 + KING]) != 1:
+            raise ValueError(f"FEN needs one {COLOURS[colour].lower()} king: {fields[0]}")
+    if fields[1] not in ('w', 'b'):
+        raise ValueError(f"FEN side to move must be w or b: {fields[1]}")
+    position.side = WHITE if fields[1] == 'w' else BLACK
+    for char in fields[2]:
+        position.castling |= CASTLING_LETTERS.get(char, 0)
+    # Rights whose king or rook is not on its starting square are dropped,
+    # the move generator takes the rights it is given at their word
+    for right, king_sq, _, rook_sq in CASTLING:
+        colour = WHITE if king_sq < 8 else BLACK
+        if position.squares[king_sq] != colour * 6 + KING or position.squares[rook_sq] != colour * 6 + ROOK:
+            position.castling &= ~right
+    if fields[3] != '-':
+        if len(fields[3]) != 2 or fields[3][0] not in 'abcdefgh' or fields[3][1] not in '12345678':
+            raise ValueError(f"not an en passant square: {fields[3]}")
+        ep_square = parse_square(fields[3])
+        # The pawn that just moved two squares stands in front of the en
+        # passant square, which it and the square it came from left empty
+        forward = -8 if position.side == WHITE else 8
+        them = 1 - position.side
+        if (ep_square >> 3 != (5 if position.side == WHITE else 2)
+                or position.squares[ep_square] is not None
+                or position.squares[ep_square - forward] is not None
+                or position.squares[ep_square + forward] != them * 6 + PAWN):
+            raise ValueError(f"no pawn to take en passant on {fields[3]}")
+        position.ep_square = ep_square
+    position.refresh()
+    return position
+
+
+def fen_counters(fen):
+    # (halfmove clock, fullmove number) of a FEN, 0 and 1 when left out
+    fields = fen.split()
+    halfmove = int(fields[4]) if len(fields) > 4 else 0
+    fullmove = int(fields[5]) if len(fields) > 5 else 1
+    return halfmove, fullmove
+
+
+def position_to_fen(position, halfmove=0, fullmove=1):
+    # A Position does not track the move counters, they are passed in
+    ranks = []
+    for row in range(7, -1, -1):
+        rank = ''
+        empty = 0
+        for col in range(8):
+            code = position.squares[square(row, col)]
+            if code is None:
+                empty += 1
+                continue
+            if empty:
+                rank += str(empty)
+                empty = 0
+            letter = PIECE_TYPES[code % 6]
+            rank += letter if code < 6 else letter.lower()
+        if empty:
+            rank += str(empty)
+        ranks.append(rank)
+    castling = ''.join(letter for letter, right in CASTLING_LETTERS.items() if position.castling & right) or '-'
+    ep = square_name(position.ep_square) if position.ep_square is not None else '-'
+    side = 'w' if position.side == WHITE else 'b'
+    return f"{'/'.join(ranks)} {side} {castling} {ep} {halfmove} {fullmove}"
+
+
+def read_fens(stream):
+    # Yield a Position for every FEN line of a stream, straight onto the
+    # bitboards. Blank lines and # comments are skipped, and anything after a
+    # ; is dropped so EPD style perft suites can be read too.
+    for number, line in enumerate(stream, 1):
+        line = line.split(';', 1)[0].strip()
+        if not line or line.startswith('#'):
+            continue
+        try:
+            yield position_from_fen(line)
+        except (ValueError, IndexError):
+            raise ValueError(f"line {number}: not a FEN: {line}")
+
+
+def board_from_fen(fen, piece_class):
+    # An 8x8 list board of piece_class(colour, piece_type) objects for the GUI
+    # and CLI, with the side to move, the castling rights and the en passant
+    # square
+    position = position_from_fen(fen)
+    board = [[None for _ in range(8)] for _ in range(8)]
+    for sq in range(64):
+        code = position.squares[sq]
+        if code is not None:
+            board[sq >> 3][sq & 7] = piece_class(COLOURS[code // 6], PIECE_TYPES[code % 6])
+    return board, COLOURS[position.side], position.castling, position.ep_square
+
+
+def board_to_fen(board, side, castling=None, ep_square=None, halfmove=0, fullmove=1):
+    # FEN of a list board, side being 'WHITE' or 'BLACK'
+    return position_to_fen(Position.from_board(board, side, castling, ep_square), halfmove, fullmove)
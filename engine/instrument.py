@@ -0,0 +1,153 @@
+import argparse
+import sys
+import time
+
+from engine import rules
+from engine.bitboard import PIECE_TYPES
+from engine.fen import START_FEN, position_from_fen
+from engine.move import move_from, move_to, promotion_type
+from engine.movegen import move_from_san
+from engine.pgn import read_games, san_moves
+from engine.position import Position
+
+# Call counters and timers for the list board rules. Nothing is counted until
+# enable() swaps the functions below for timed wrappers, so with it off the
+# rules run exactly the code they would without this module.
+
+# (owner, attribute) of every function that is counted. Game finds checks
+# and the end of the game on its bitboards, so those are counted there:
+# has_legal_move as engine.rules calls it, and Position.in_check for every
+# caller, the search included.
+PROBES = (
+    (rules, 'is_valid_move'),
+    (rules, 'has_legal_move'),
+    (Position, 'in_check'),
+    (rules.Game, 'find_checked_king'),
+    (rules.Game, 'game_over'),
+    (rules.Game, 'make_move'),
+    (rules.Game, 'unmake_move'),
+)
+
+# name -> [calls, seconds], times include the calls a function makes
+_counters = {}
+# The original functions while enabled, else empty
+_originals = {}
+_trace = None
+
+
+def _wrap(name, function):
+    counter = _counters.setdefault(name, [0, 0.0])
+    clock = time.perf_counter
+
+    def wrapper(*args, **kwargs):
+        start = clock()
+        result = function(*args, **kwargs)
+        elapsed = clock() - start
+        counter[0] += 1
+        counter[1] += elapsed
+        if _trace is not None:
+            # Boards and games would swamp the log, squares and colours are enough
+            shown = ', '.join(repr(arg) for arg in args if isinstance(arg, (tuple, str)))
+            _trace.write(f"{name}({shown}) -> {result!r} {elapsed * 1e6:.1f} us\n")
+        return result
+
+    wrapper.__name__ = function.__name__
+    wrapper.__wrapped__ = function
+    return wrapper
+
+
+def enable(trace=None):
+    # Start counting. trace is an optional file that gets one line per call.
+    global _trace
+    _trace = trace
+    for owner, attribute in PROBES:
+        name = attribute if owner is rules else f"{owner.__name__}.{attribute}"
+        if name not in _originals:
+            _originals[name] = (owner, attribute, getattr(owner, attribute))
+            setattr(owner, attribute, _wrap(name, getattr(owner, attribute)))
+
+
+def disable():
+    # Put the original functions back, the counts are kept until reset()
+    global _trace
+    for owner, attribute, function in _originals.values():
+        setattr(owner, attribute, function)
+    _originals.clear()
+    _trace = None
+
+
+def enabled():
+    return bool(_originals)
+
+
+def reset():
+    for counter in _counters.values():
+        counter[0] = 0
+        counter[1] = 0.0
+
+
+def stats():
+    # Snapshot of {name: {'calls', 'seconds', 'us_per_call'}}
+    return {name: {'calls': calls, 'seconds': seconds,
+                   'us_per_call': seconds * 1e6 / calls if calls else 0.0}
+            for name, (calls, seconds) in _counters.items()}
+
+
+def report(file=sys.stdout):
+    for name, counts in sorted(stats().items(), key=lambda item: -item[1]['seconds']):
+        print(f"{name:22} {counts['calls']:>10} calls {counts['seconds']:>9.3f} s "
+              f"{counts['us_per_call']:>9.1f} us/call", file=file)
+
+
+def replay(movetext, fen=START_FEN):
+    # Play a game's moves on a list board Game, the way the GUI and the CLI
+    # would. Returns the number of moves played before the first one the
+    # list board rules turned down.
+    game = rules.Game(fen)
+    position = position_from_fen(fen)
+    played = 0
+    for san in san_moves(movetext):
+        move = move_from_san(position, san)
+        if move is None:
+            break
+        promoted = promotion_type(move)
+        if not game.make_move(divmod(move_from(move), 8), divmod(move_to(move), 8),
+                              PIECE_TYPES[promoted] if promoted is not None else None):
+            break
+        position.make(move)
+        played += 1
+    return played
+
+
+def main(argv=None):
+    # python -m engine.instrument [--trace FILE] [file ...]
+    # Replays PGN games on the list board rules and prints where the time went
+    parser = argparse.ArgumentParser(description="Count and time the list board rules over PGN games")
+    parser.add_argument('--trace', help="file that gets a line for every counted call")
+    parser.add_argument('files', nargs='*', help="PGN files, stdin when none or -")
+    args = parser.parse_args(argv)
+
+    trace = open(args.trace, 'w') if args.trace else None
+    enable(trace)
+    start = time.perf_counter()
+    games = moves = 0
+    try:
+        for name in args.files or ['-']:
+            stream = sys.stdin if name == '-' else open(name, encoding='utf-8', errors='replace')
+            with stream:
+                for tags, movetext in read_games(stream):
+                    games += 1
+                    moves += replay(movetext, tags.get('FEN', START_FEN))
+    finally:
+        disable()
+        if trace:
+            trace.close()
+    elapsed = time.perf_counter() - start
+    print(f"{games} games, {moves} moves, {elapsed:.2f} s, "
+          f"{moves / elapsed if elapsed > 0 else 0:.0f} moves/s")
+    report()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
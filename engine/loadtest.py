@@ -0,0 +1,117 @@
+import argparse
+import asyncio
+import random
+import sys
+import time
+
+from engine.fen import START_FEN, position_from_fen
+from engine.move import move_to_uci
+from engine.movegen import legal_moves
+from engine.server import DEFAULT_PORT
+
+# Plays many games against engine.server at once and reports the moves per
+# second the server kept up and the latency of each move, from sending it to
+# the server's reply. Every player is its own connection.
+
+
+def random_games(count, plies, seed):
+    # Move lists in UCI of random legal games, which the players replay. A
+    # game may end early in mate or stalemate.
+    rng = random.Random(seed)
+    games = []
+    for _ in range(count):
+        position = position_from_fen(START_FEN)
+        moves = []
+        for _ in range(plies):
+            choices = legal_moves(position)
+            if not choices:
+                break
+            move = rng.choice(choices)
+            moves.append(move_to_uci(move))
+            position.make(move)
+        games.append(moves)
+    return games
+
+
+class LoadTest:
+    def __init__(self, host, port, games):
+        self.host = host
+        self.port = port
+        self.games = games
+        self.latencies = []
+        self.moves = 0
+        self.errors = 0
+        self.finished = 0
+
+    async def player(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            writer.write(b'play\n')
+            words = (await reader.readline()).decode().split()
+            if words and words[0] == 'wait':
+                words = (await reader.readline()).decode().split()
+            if not words or words[0] != 'start':
+                self.errors += 1
+                return
+            number, colour = int(words[1]), words[2]
+            moves = self.games[number % len(self.games)]
+            ply = 0
+            sent = None
+            while ply < len(moves):
+                if (ply % 2 == 0) == (colour == 'WHITE'):
+                    sent = time.perf_counter()
+                    writer.write(f"move {moves[ply]}\n".encode())
+                words = (await reader.readline()).decode().split()
+                if not words or words[0] != 'moved':
+                    # illegal, error or the other player gave up
+                    self.errors += 1
+                    return
+                if sent is not None:
+                    self.latencies.append(time.perf_counter() - sent)
+                    self.moves += 1
+                    sent = None
+                ply += 1
+            # White ends the game, both wait to hear it is over
+            if colour == 'WHITE':
+                writer.write(b'resign\n')
+            while words and words[0] != 'over':
+                words = (await reader.readline()).decode().split()
+            self.finished += 1
+        finally:
+            writer.close()
+
+    async def run(self, players):
+        await asyncio.gather(*(self.player() for _ in range(players)))
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main(argv=None):
+    # python -m engine.loadtest [--games N] [--plies N] [--host HOST] [--port PORT]
+    parser = argparse.ArgumentParser(description="Load test engine.server with many games at once")
+    parser.add_argument('--host', default='127.0.0.1', help="server address")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="server port")
+    parser.add_argument('--games', type=int, default=1000, help="games played at the same time")
+    parser.add_argument('--plies', type=int, default=40, help="moves played in each game")
+    parser.add_argument('--seed', type=int, default=1, help="seed for the random games")
+    args = parser.parse_args(argv)
+
+    test = LoadTest(args.host, args.port, random_games(64, args.plies, args.seed))
+    start = time.perf_counter()
+    asyncio.run(test.run(args.games * 2))
+    elapsed = time.perf_counter() - start
+    print(f"{test.finished // 2} games, {test.moves} moves in {elapsed:.2f} s, "
+          f"{test.moves / elapsed if elapsed > 0 else 0:.0f} moves/s, {test.errors} errors")
+    print(f"latency p50 {percentile(test.latencies, 0.5) * 1000:.1f} ms, "
+          f"p99 {percentile(test.latencies, 0.99) * 1000:.1f} ms, "
+          f"max {max(test.latencies, default=0) * 1000:.1f} ms")
+    return 1 if test.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
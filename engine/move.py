@@ -0,0 +1,45 @@
+from engine.bitboard import KNIGHT, PIECE_TYPES, square_name
+
+# A move is an int: from square in bits 0-5, to square in bits 6-11 and a
+# four bit flag in bits 12-15.
+QUIET = 0
+DOUBLE_PUSH = 1
+KING_CASTLE = 2
+QUEEN_CASTLE = 3
+CAPTURE = 4
+EP_CAPTURE = 5
+# Promotions set this bit (plus CAPTURE when taking) and keep the promoted
+# piece in the low two bits: knight, bishop, rook, queen.
+PROMOTION = 8
+
+
+def encode(from_sq, to_sq, flag=QUIET):
+    return from_sq | to_sq << 6 | flag << 12
+
+
+def move_from(move):
+    return move & 63
+
+
+def move_to(move):
+    return move >> 6 & 63
+
+
+def move_flag(move):
+    return move >> 12
+
+
+def promotion_type(move):
+    # Piece type a promotion turns into, None for other moves
+    if move >> 12 & PROMOTION:
+        return KNIGHT + (move >> 12 & 3)
+    return None
+
+
+def move_to_uci(move):
+    text = square_name(move & 63) + square_name(move >> 6 & 63)
+    promoted = promotion_type(move)
+    if promoted is not None:
+        text += PIECE_TYPES[promoted].lower()
+    return text
+
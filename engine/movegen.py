@@ -0,0 +1,283 @@
+from engine.bitboard import (
+    WHITE, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, PIECE_TYPES, FULL,
+    KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, BETWEEN,
+    rook_attacks, bishop_attacks, square_name, parse_square,
+)
+from engine.move import QUIET, DOUBLE_PUSH, KING_CASTLE, QUEEN_CASTLE, CAPTURE, EP_CAPTURE, PROMOTION, promotion_type
+from engine.position import CASTLING, piece_attacks
+
+
+def _add_targets(moves, from_sq, targets, theirs):
+    while targets:
+        low = targets & -targets
+        to_sq = low.bit_length() - 1
+        targets ^= low
+        moves.append(from_sq | to_sq << 6 | (CAPTURE << 12 if theirs & low else 0))
+
+
+def _add_pawn_move(moves, from_sq, to_sq, flag):
+    if to_sq >> 3 in (0, 7):
+        for promoted in range(4):
+            moves.append(from_sq | to_sq << 6 | (flag | PROMOTION | promoted) << 12)
+    else:
+        moves.append(from_sq | to_sq << 6 | flag << 12)
+
+
+def _check_and_pins(position, king, king_mask):
+    # Checks and pins of the side to move, whose king is on king, worked out
+    # once so no move has to be played to test its legality. Returns the
+    # king's safe steps within king_mask, the checking pieces, the squares
+    # other pieces may move to (all of them out of check, the checker and
+    # the line to it in check), the line each pinned piece is held to by
+    # square, and the enemy's straight and diagonal sliders.
+    side = position.side
+    them = side ^ 1
+    pieces = position.pieces
+    theirs = position.occupied[them]
+    occupied = position.occupied[side] | theirs
+    base = them * 6
+
+    # King steps. A slider giving check also covers the squares behind the
+    # king on its line, which the attack map cannot see past the king.
+    enemy_attacks = position.attack_maps[them]
+    checkers = position.attackers(king, them) if enemy_attacks >> king & 1 else 0
+    targets = KING_ATTACKS[king] & king_mask & ~enemy_attacks
+    sliding_checkers = checkers & ~(pieces[base + PAWN] | pieces[base + KNIGHT])
+    if targets and sliding_checkers:
+        without_king = occupied ^ (1 << king)
+        while sliding_checkers:
+            low = sliding_checkers & -sliding_checkers
+            checker = low.bit_length() - 1
+            sliding_checkers ^= low
+            targets &= ~piece_attacks(checker, position.squares[checker], without_king)
+
+    if checkers:
+        checker = checkers.bit_length() - 1
+        allowed = checkers | BETWEEN[king][checker]
+    else:
+        allowed = FULL
+
+    # Pieces pinned to the king may only move along the pin line
+    pinned = {}
+    straight = pieces[base + ROOK] | pieces[base + QUEEN]
+    diagonal = pieces[base + BISHOP] | pieces[base + QUEEN]
+    snipers = (rook_attacks(king, theirs) & straight) | (bishop_attacks(king, theirs) & diagonal)
+    while snipers:
+        low = snipers & -snipers
+        sniper = low.bit_length() - 1
+        snipers ^= low
+        blockers = BETWEEN[king][sniper] & occupied
+        if blockers and not blockers & (blockers - 1):
+            pinned[blockers.bit_length() - 1] = BETWEEN[king][sniper] | low
+    return targets, checkers, allowed, pinned, straight, diagonal
+
+
+def _en_passant_legal(king, occupied, pawn, captured, ep_square, checkers, straight, diagonal):
+    # Play the capture on the occupancy and look for any attack on the king,
+    # which covers the rare rank pin of both pawns
+    after = (occupied ^ pawn ^ captured) | 1 << ep_square
+    return (not (rook_attacks(king, after) & straight)
+            and not (bishop_attacks(king, after) & diagonal)
+            and not (checkers & ~captured & ~(straight | diagonal)))
+
+
+def legal_moves(position, captures_only=False):
+    # Every legal move for the side to move, with checks and pins from
+    # _check_and_pins. captures_only keeps just captures and promotions, for
+    # quiescence search.
+    moves = []
+    side = position.side
+    pieces = position.pieces
+    ours = position.occupied[side]
+    theirs = position.occupied[side ^ 1]
+    occupied = ours | theirs
+    king = position.king_square(side)
+    if king is None:
+        return moves
+
+    targets, checkers, allowed, pinned, straight, diagonal = _check_and_pins(
+        position, king, theirs if captures_only else ~ours)
+    _add_targets(moves, king, targets, theirs)
+    if checkers & (checkers - 1):
+        # Double check, only the king can move
+        return moves
+    if not checkers and not captures_only:
+        enemy_attacks = position.attack_maps[side ^ 1]
+        for right, king_sq, king_to, rook_sq in CASTLING:
+            if (position.castling & right and king == king_sq
+                    and not occupied & BETWEEN[king_sq][rook_sq]
+                    and not enemy_attacks & (1 << king_to | 1 << ((king_sq + king_to) >> 1))):
+                moves.append(king_sq | king_to << 6 | (KING_CASTLE if king_to > king_sq else QUEEN_CASTLE) << 12)
+
+    target_mask = ~ours & allowed
+    piece_mask = target_mask & theirs if captures_only else target_mask
+    own = side * 6
+
+    knights = pieces[own + KNIGHT]
+    while knights:
+        low = knights & -knights
+        from_sq = low.bit_length() - 1
+        knights ^= low
+        if from_sq not in pinned:
+            _add_targets(moves, from_sq, KNIGHT_ATTACKS[from_sq] & piece_mask, theirs)
+
+    for piece_type, attacks in ((BISHOP, bishop_attacks), (ROOK, rook_attacks)):
+        sliders = pieces[own + piece_type] | pieces[own + QUEEN]
+        while sliders:
+            low = sliders & -sliders
+            from_sq = low.bit_length() - 1
+            sliders ^= low
+            targets = attacks(from_sq, occupied) & piece_mask
+            if from_sq in pinned:
+                targets &= pinned[from_sq]
+            _add_targets(moves, from_sq, targets, theirs)
+
+    forward = 8 if side == WHITE else -8
+    start_row = 1 if side == WHITE else 6
+    ep_square = position.ep_square
+    pawns = pieces[own + PAWN]
+    while pawns:
+        low = pawns & -pawns
+        from_sq = low.bit_length() - 1
+        pawns ^= low
+        mask = target_mask & pinned.get(from_sq, FULL)
+        to_sq = from_sq + forward
+        if not occupied >> to_sq & 1 and (not captures_only or to_sq >> 3 in (0, 7)):
+            if mask >> to_sq & 1:
+                _add_pawn_move(moves, from_sq, to_sq, QUIET)
+            if from_sq >> 3 == start_row:
+                two = to_sq + forward
+                if not occupied >> two & 1 and mask >> two & 1:
+                    moves.append(from_sq | two << 6 | DOUBLE_PUSH << 12)
+        captures = PAWN_ATTACKS[side][from_sq] & theirs & mask
+        while captures:
+            cap = captures & -captures
+            captures ^= cap
+            _add_pawn_move(moves, from_sq, cap.bit_length() - 1, CAPTURE)
+        if (ep_square is not None and PAWN_ATTACKS[side][from_sq] >> ep_square & 1
+                and _en_passant_legal(king, occupied, low, 1 << (ep_square - forward), ep_square,
+                                      checkers, straight, diagonal)):
+            moves.append(from_sq | ep_square << 6 | EP_CAPTURE << 12)
+    return moves
+
+
+def has_legal_move(position):
+    # Whether the side to move has any legal move, answered without building
+    # the move list: the same checks and pins as legal_moves, stopping at
+    # the first move found. Castling is never needed, a king that may castle
+    # may also step to the square it passes. Mate and stalemate tests run
+    # this after every move.
+    side = position.side
+    pieces = position.pieces
+    ours = position.occupied[side]
+    theirs = position.occupied[side ^ 1]
+    occupied = ours | theirs
+    king = position.king_square(side)
+    if king is None:
+        return False
+
+    targets, checkers, allowed, pinned, straight, diagonal = _check_and_pins(position, king, ~ours)
+    if targets:
+        return True
+    if checkers & (checkers - 1):
+        return False
+    target_mask = ~ours & allowed
+    own = side * 6
+
+    # Pawns first, they are the most numerous and rarely all blocked
+    forward = 8 if side == WHITE else -8
+    start_row = 1 if side == WHITE else 6
+    ep_square = position.ep_square
+    pawns = pieces[own + PAWN]
+    while pawns:
+        low = pawns & -pawns
+        from_sq = low.bit_length() - 1
+        pawns ^= low
+        mask = target_mask & pinned.get(from_sq, FULL)
+        to_sq = from_sq + forward
+        if not occupied >> to_sq & 1:
+            if mask >> to_sq & 1:
+                return True
+            if from_sq >> 3 == start_row:
+                two = to_sq + forward
+                if not occupied >> two & 1 and mask >> two & 1:
+                    return True
+        if PAWN_ATTACKS[side][from_sq] & theirs & mask:
+            return True
+        if (ep_square is not None and PAWN_ATTACKS[side][from_sq] >> ep_square & 1
+                and _en_passant_legal(king, occupied, low, 1 << (ep_square - forward), ep_square,
+                                      checkers, straight, diagonal)):
+            return True
+
+    knights = pieces[own + KNIGHT]
+    while knights:
+        low = knights & -knights
+        from_sq = low.bit_length() - 1
+        knights ^= low
+        if from_sq not in pinned and KNIGHT_ATTACKS[from_sq] & target_mask:
+            return True
+
+    for piece_type, attacks in ((BISHOP, bishop_attacks), (ROOK, rook_attacks)):
+        sliders = pieces[own + piece_type] | pieces[own + QUEEN]
+        while sliders:
+            low = sliders & -sliders
+            from_sq = low.bit_length() - 1
+            sliders ^= low
+            if attacks(from_sq, occupied) & target_mask & pinned.get(from_sq, FULL):
+                return True
+    return False
+
+
+def move_from_uci(position, text):
+    # Look the text up among the legal moves so the flags are filled in
+    from_sq, to_sq = parse_square(text[0:2]), parse_square(text[2:4])
+    promoted = PIECE_TYPES.index(text[4].upper()) if len(text) > 4 else None
+    for move in legal_moves(position):
+        if move & 63 == from_sq and move >> 6 & 63 == to_sq and promotion_type(move) == promoted:
+            return move
+    return None
+
+
+def move_from_san(position, text):
+    # Standard algebraic notation such as Nbd7, exd6, e8=Q+ or O-O-O. None
+    # when no legal move, or more than one, fits the text.
+    text = text.rstrip('+#!?')
+    if text.endswith('e.p.'):
+        text = text[:-4]
+    moves = legal_moves(position)
+    if text in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+        flag = KING_CASTLE if len(text) == 3 else QUEEN_CASTLE
+        found = [move for move in moves if move >> 12 == flag]
+        return found[0] if found else None
+
+    promoted = None
+    if '=' in text:
+        text, letter = text.split('=', 1)
+        promoted = PIECE_TYPES.index(letter.upper())
+    elif len(text) > 2 and text[-1] in 'NBRQ' and text[0].islower():
+        promoted = PIECE_TYPES.index(text[-1])
+        text = text[:-1]
+    if text and text[0] in 'NBRQK':
+        piece_type = PIECE_TYPES.index(text[0])
+        text = text[1:]
+    else:
+        piece_type = PAWN
+    text = text.replace('x', '').replace('-', '')
+    if len(text) < 2 or text[-2] not in 'abcdefgh' or text[-1] not in '12345678':
+        return None
+    to_sq = parse_square(text[-2:])
+    hint = text[:-2]
+    squares = position.squares
+    found = None
+    for move in moves:
+        from_sq = move & 63
+        if (move >> 6 & 63 != to_sq or squares[from_sq] % 6 != piece_type
+                or promotion_type(move) != promoted or move >> 12 in (KING_CASTLE, QUEEN_CASTLE)):
+            continue
+        name = square_name(from_sq)
+        if any(char not in name for char in hint):
+            continue
+        if found is not None:
+            return None
+        found = move
+    return found
@@ -0,0 +1,109 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from multiprocessing import shared_memory
+
+from engine.fen import START_FEN, position_from_fen, position_to_fen
+from engine.move import move_to_uci
+from engine.search import DEFAULT_HASH_MB, MAX_PLY, Search, SearchResult, search
+from engine.tt import BUCKET_BYTES, TranspositionTable, bucket_count
+
+# Per process state of a pool worker, set up once by _attach
+_memory = None
+_table = None
+_stop = None
+
+
+def _attach(name, stop):
+    global _memory, _table, _stop
+    _memory = shared_memory.SharedMemory(name=name)
+    _table = TranspositionTable(buffer=_memory.buf)
+    _stop = stop
+
+
+def _search(fen, time_limit, max_depth, index, generation):
+    # Runs in a worker. Every worker searches the whole tree and they help each
+    # other through the shared table; odd helpers start a ply deeper so they
+    # run ahead of the main worker instead of repeating it.
+    _table.generation = generation
+    _table.probes = _table.hits = 0
+    result = Search(position_from_fen(fen), time_limit, max_depth, tt=_table,
+                    stop=_stop, start_depth=1 + index % 2).run()
+    return result.move, result.score, result.depth, result.nodes, result.pv, _table.probes, _table.hits
+
+
+class ParallelSearch:
+    # Lazy SMP over a process pool. The transposition table lives in shared
+    # memory that every worker maps, and positions are sent to the workers as
+    # FEN strings. The main worker decides when the search is over, the
+    # helpers are stopped as soon as it returns. Keep one instance for a whole
+    # game, starting the pool is far slower than a search.
+    def __init__(self, workers=None, hash_mb=DEFAULT_HASH_MB):
+        self.workers = workers or os.cpu_count() or 1
+        self.memory = shared_memory.SharedMemory(create=True, size=bucket_count(hash_mb) * BUCKET_BYTES)
+        self.stop = multiprocessing.Event()
+        self.pool = multiprocessing.Pool(self.workers, initializer=_attach, initargs=(self.memory.name, self.stop))
+        self.generation = 0
+        self.hit_rate = 0.0
+
+    def search(self, position, time_limit=1.0, max_depth=MAX_PLY):
+        fen = position_to_fen(position)
+        self.stop.clear()
+        start = time.perf_counter()
+        jobs = [self.pool.apply_async(_search, (fen, time_limit, max_depth, index, self.generation))
+                for index in range(self.workers)]
+        results = [jobs[0].get()]
+        self.stop.set()
+        results += [job.get() for job in jobs[1:]]
+        elapsed = time.perf_counter() - start
+        self.generation = (self.generation + 1) & 0xFF
+
+        # The deepest finished iteration wins, the main worker on a tie
+        move, score, depth, _, pv, _, _ = max(results, key=lambda result: result[2])
+        nodes = sum(result[3] for result in results)
+        probes = sum(result[5] for result in results)
+        self.hit_rate = sum(result[6] for result in results) / probes if probes else 0.0
+        return SearchResult(move, score, depth, nodes, elapsed, pv)
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+        self.memory.close()
+        self.memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main(argv=None):
+    # python -m engine.parallel [--workers N] [--depth N] [--time SECONDS] [fen]
+    # Searches the position to the same depth in one process and then in
+    # parallel, and reports the speedup in time to depth.
+    parser = argparse.ArgumentParser(description="Compare a parallel search with a single process one")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="worker processes, all cores by default")
+    parser.add_argument('--depth', type=int, default=5, help="depth both searches run to")
+    parser.add_argument('--time', type=float, default=60.0, help="time budget in seconds for each search")
+    parser.add_argument('--hash', type=int, default=DEFAULT_HASH_MB, help="transposition table size in MB")
+    parser.add_argument('fen', nargs='*', help="position to search, the start position by default")
+    args = parser.parse_args(argv)
+    position = position_from_fen(' '.join(args.fen) if args.fen else START_FEN)
+
+    single = search(position, args.time, args.depth, tt=TranspositionTable(args.hash))
+    print(f"1 process:   {single}")
+    with ParallelSearch(args.workers, args.hash) as parallel:
+        result = parallel.search(position, args.time, args.depth)
+        print(f"{parallel.workers} processes: {result}")
+        print(f"shared hash hit rate {parallel.hit_rate:.1%}")
+    print(f"bestmove {move_to_uci(result.move) if result.move else '(none)'} "
+          f"speedup {single.elapsed / result.elapsed:.2f}x "
+          f"nps {result.nps / single.nps if single.nps else 0:.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
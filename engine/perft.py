@@ -0,0 +1,70 @@
+import sys
+import time
+
+from engine.fen import START_FEN, position_from_fen
+from engine.move import move_to_uci
+from engine.movegen import legal_moves
+
+# Standard perft test positions with their known node counts by depth
+POSITIONS = [
+    ('start', START_FEN, [20, 400, 8902, 197281, 4865609]),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1', [48, 2039, 97862, 4085603]),
+    ('position 3', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1', [14, 191, 2812, 43238, 674624]),
+    ('position 4', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1', [6, 264, 9467, 422333]),
+    ('position 5', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8', [44, 1486, 62379, 2103487]),
+    ('position 6', 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10', [46, 2079, 89890, 3894594]),
+]
+
+
+def perft(position, depth):
+    moves = legal_moves(position)
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        position.make(move)
+        nodes += perft(position, depth - 1)
+        position.unmake()
+    return nodes
+
+
+def divide(position, depth):
+    # Node count below each root move, for tracking down a wrong total
+    counts = {}
+    for move in legal_moves(position):
+        position.make(move)
+        counts[move_to_uci(move)] = perft(position, depth - 1) if depth > 1 else 1
+        position.unmake()
+    return counts
+
+
+def main(argv=None):
+    # python -m engine.perft [depth] [fen]
+    argv = sys.argv[1:] if argv is None else argv
+    depth = int(argv[0]) if argv else 3
+    if len(argv) > 1:
+        positions = [('fen', ' '.join(argv[1:]), [])]
+    else:
+        positions = POSITIONS
+    failed = False
+    total_nodes = 0
+    total_time = 0.0
+    for name, fen, expected in positions:
+        position = position_from_fen(fen)
+        start = time.perf_counter()
+        nodes = perft(position, depth) if depth > 0 else 1
+        elapsed = time.perf_counter() - start
+        total_nodes += nodes
+        total_time += elapsed
+        status = ''
+        if depth <= len(expected):
+            ok = nodes == expected[depth - 1]
+            failed = failed or not ok
+            status = 'ok' if ok else f'FAIL expected {expected[depth - 1]}'
+        print(f"{name:<12} depth {depth}  nodes {nodes:>10}  {elapsed:8.3f}s  {nodes / max(elapsed, 1e-9):>10.0f} nps  {status}")
+    print(f"{'total':<12} depth {depth}  nodes {total_nodes:>10}  {total_time:8.3f}s  {total_nodes / max(total_time, 1e-9):>10.0f} nps")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+import argparse
+import multiprocessing
+import os
+import re
+import sys
+import time
+from collections import deque
+from itertools import islice
+
+from engine.bitboard import PAWN
+from engine.fen import START_FEN, fen_counters, position_from_fen, position_to_fen
+from engine.move import CAPTURE
+from engine.movegen import move_from_san
+
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+TAG = re.compile(r'\[(\w+)\s+"(.*)"\]')
+# Comments, variation brackets, NAGs and everything else between spaces
+TOKEN = re.compile(r'\{[^}]*\}|;[^\n]*|[()]|\$\d+|[^\s(){};]+')
+MOVE_NUMBER = re.compile(r'^\d+\.+')
+
+
+def read_games(stream):
+    # Yield (tags, movetext) for each game of a PGN stream, one at a time, so
+    # an archive of any size is read in constant memory
+    tags = {}
+    movetext = []
+    for line in stream:
+        line = line.strip()
+        if line.startswith('['):
+            if movetext:
+                yield tags, ' '.join(movetext)
+                tags = {}
+                movetext = []
+            match = TAG.match(line)
+            if match:
+                tags[match.group(1)] = match.group(2)
+        elif line and not line.startswith('%'):
+            movetext.append(line)
+    if tags or movetext:
+        yield tags, ' '.join(movetext)
+
+
+def san_moves(movetext):
+    # The moves of the main line, without move numbers, comments,
+    # variations, NAGs or the result
+    depth = 0
+    for token in TOKEN.findall(movetext):
+        if token == '(':
+            depth += 1
+        elif token == ')':
+            depth -= 1
+        elif depth or token[0] in '{;$' or token in RESULTS:
+            continue
+        else:
+            token = MOVE_NUMBER.sub('', token)
+            if token:
+                yield token
+
+
+def validate_game(tags, movetext):
+    # (legal, ply of the first illegal move or None, final FEN, plies played).
+    # The final position is the one before the illegal move, its move
+    # counters carried on from the start FEN's.
+    fen = tags.get('FEN', START_FEN)
+    position = position_from_fen(fen)
+    halfmove, fullmove = fen_counters(fen)
+    first_side = position.side
+    ply = 0
+
+    def final_fen():
+        return position_to_fen(position, halfmove, fullmove + (ply + first_side) // 2)
+
+    for san in san_moves(movetext):
+        move = move_from_san(position, san)
+        if move is None:
+            return False, ply + 1, final_fen(), ply
+        if move >> 12 >= CAPTURE or position.squares[move & 63] % 6 == PAWN:
+            halfmove = 0
+        else:
+            halfmove += 1
+        position.make(move)
+        ply += 1
+    return True, None, final_fen(), ply
+
+
+def _validate_batch(batch):
+    results = []
+    for number, tags, movetext in batch:
+        try:
+            results.append((number,) + validate_game(tags, movetext))
+        except Exception:
+            # An unreadable FEN tag, or a position the rules cannot make
+            # sense of. It marks this game bad rather than ending the run.
+            results.append((number, False, 0, tags.get('FEN', ''), 0))
+    return results
+
+
+def validate(stream, workers=None, batch_size=64):
+    # Yield (game number, legal, first illegal ply, final FEN, plies) for every
+    # game in the stream, in order. Games go to a process pool in batches,
+    # and only a couple of batches per worker are ever in flight, so memory
+    # stays bounded however long the archive is.
+    workers = workers or os.cpu_count() or 1
+    games = ((number, tags, movetext) for number, (tags, movetext) in enumerate(read_games(stream), 1))
+    with multiprocessing.Pool(workers) as pool:
+        pending = deque()
+        while True:
+            while len(pending) < workers * 2:
+                batch = list(islice(games, batch_size))
+                if not batch:
+                    break
+                pending.append(pool.apply_async(_validate_batch, (batch,)))
+            if not pending:
+                break
+            yield from pending.popleft().get()
+
+
+def peak_memory_mb():
+    # Peak resident memory of this process in MB, or None where there is no
+    # resource module (Windows). engine.pgn is imported by the GUI, so the
+    # module is only looked for here.
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS counts bytes, Linux and the BSDs kilobytes
+    return peak // (1024 * 1024) if sys.platform == 'darwin' else peak // 1024
+
+
+def main(argv=None):
+    # python -m engine.pgn [--workers N] [--batch N] [--output FILE] [file ...]
+    # Writes one tab separated line per game: number, legal or illegal, the
+    # ply of the first illegal move (- when legal) and the final FEN. The
+    # summary goes to stderr.
+    parser = argparse.ArgumentParser(description="Check every move of PGN games against the move rules")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="worker processes, all cores by default")
+    parser.add_argument('--batch', type=int, default=64, help="games sent to a worker at a time")
+    parser.add_argument('--output', help="file for the per game results, stdout by default")
+    parser.add_argument('files', nargs='*', help="PGN files, stdin when none or -")
+    args = parser.parse_args(argv)
+
+    output = open(args.output, 'w') if args.output else sys.stdout
+    start = time.perf_counter()
+    games = illegal = 0
+    try:
+        for name in args.files or ['-']:
+            stream = sys.stdin if name == '-' else open(name, encoding='utf-8', errors='replace')
+            with stream:
+                for _, legal, ply, fen, _ in validate(stream, args.workers, args.batch):
+                    games += 1
+                    if not legal:
+                        illegal += 1
+                    output.write(f"{games}\t{'legal' if legal else 'illegal'}\t{ply if ply is not None else '-'}\t{fen}\n")
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    elapsed = time.perf_counter() - start
+    peak = peak_memory_mb()
+    print(f"{games} games, {illegal} illegal, {elapsed:.2f} s, "
+          f"{games / elapsed if elapsed > 0 else 0:.0f} games/s"
+          + (f", peak memory {peak} MB" if peak is not None else ""),
+          file=sys.stderr)
+    return 1 if illegal else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
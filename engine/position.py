@@ -0,0 +1,340 @@
+from engine.bitboard import (
+    WHITE, BLACK, COLOUR_INDEX, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, PIECE_TYPES,
+    KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, BETWEEN,
+    rook_attacks, bishop_attacks, square,
+)
+from engine.move import DOUBLE_PUSH, KING_CASTLE, QUEEN_CASTLE, CAPTURE, EP_CAPTURE, PROMOTION
+from engine.zobrist import PIECE_KEYS, CASTLING_KEYS, SIDE_KEY, ep_key, position_key
+
+# Castling rights bits
+WHITE_KINGSIDE = 1
+WHITE_QUEENSIDE = 2
+BLACK_KINGSIDE = 4
+BLACK_QUEENSIDE = 8
+
+# (right, king square, king destination, rook square) for each castling move
+CASTLING = (
+    (WHITE_KINGSIDE, 4, 6, 7),
+    (WHITE_QUEENSIDE, 4, 2, 0),
+    (BLACK_KINGSIDE, 60, 62, 63),
+    (BLACK_QUEENSIDE, 60, 58, 56),
+)
+
+# Rights that survive a move touching the square, and'ed in for both ends
+CASTLING_KEPT = [15] * 64
+CASTLING_KEPT[4] = 15 & ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)
+CASTLING_KEPT[7] = 15 & ~WHITE_KINGSIDE
+CASTLING_KEPT[0] = 15 & ~WHITE_QUEENSIDE
+CASTLING_KEPT[60] = 15 & ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)
+CASTLING_KEPT[63] = 15 & ~BLACK_KINGSIDE
+CASTLING_KEPT[56] = 15 & ~BLACK_QUEENSIDE
+
+
+def piece_attacks(sq, code, occupied):
+    # Squares attacked by the piece with this code standing on sq
+    piece_type = code % 6
+    if piece_type == PAWN:
+        return PAWN_ATTACKS[code // 6][sq]
+    if piece_type == KNIGHT:
+        return KNIGHT_ATTACKS[sq]
+    if piece_type == BISHOP:
+        return bishop_attacks(sq, occupied)
+    if piece_type == ROOK:
+        return rook_attacks(sq, occupied)
+    if piece_type == QUEEN:
+        return bishop_attacks(sq, occupied) | rook_attacks(sq, occupied)
+    return KING_ATTACKS[sq]
+
+
+def piece_code(piece):
+    # Code of a list board Piece object, as used in Position.pieces
+    return COLOUR_INDEX[piece.colour] * 6 + PIECE_TYPES.index(piece.piece_type)
+
+
+def board_castling(board):
+    # The castling rights a list board allows: those whose king and rook
+    # still stand on their starting squares
+    rights = 0
+    for right, king_sq, _, rook_sq in CASTLING:
+        king = board[king_sq >> 3][king_sq & 7]
+        rook = board[rook_sq >> 3][rook_sq & 7]
+        colour = 'WHITE' if king_sq < 8 else 'BLACK'
+        if (king and king.piece_type == 'K' and king.colour == colour
+                and rook and rook.piece_type == 'R' and rook.colour == colour):
+            rights |= right
+    return rights
+
+
+def board_state_key(board, side, castling, ep_square):
+    # Castling and en passant part of the Zobrist key of a list board, so
+    # make_move can swap it out without hashing the whole board again
+    key = CASTLING_KEYS[castling]
+    if ep_square is not None:
+        row, col = divmod(ep_square, 8)
+        pawn_row = row - 1 if side == WHITE else row + 1
+        pawns = 0
+        for pawn_col in (col - 1, col + 1):
+            if 0 <= pawn_col <= 7:
+                piece = board[pawn_row][pawn_col]
+                if piece and piece.piece_type == 'P' and COLOUR_INDEX[piece.colour] == side:
+                    pawns |= 1 << square(pawn_row, pawn_col)
+        key ^= ep_key(ep_square, side, pawns)
+    return key
+
+
+class Position:
+    # One bitboard per colour and piece type, indexed by colour * 6 + piece
+    # type, plus an occupancy mask per colour and a 64 entry mailbox of the
+    # same codes so "what is on this square" does not need twelve lookups.
+    # attacks[sq] holds the squares attacked by the piece on sq and
+    # attack_maps the union of those per colour. make() and unmake() keep
+    # both up to date, so attack queries are a single bit test. key is the
+    # Zobrist hash of the position, also maintained move by move.
+    __slots__ = ('pieces', 'occupied', 'squares', 'side', 'castling', 'ep_square', 'undo_stack',
+                 'attacks', 'attack_maps', 'key')
+
+    def __init__(self):
+        self.pieces = [0] * 12
+        self.occupied = [0, 0]
+        self.squares = [None] * 64
+        self.side = WHITE
+        self.castling = 0
+        self.ep_square = None
+        self.undo_stack = []
+        self.attacks = [0] * 64
+        self.attack_maps = [0, 0]
+        self.key = 0
+
+    @classmethod
+    def from_board(cls, board, side=WHITE, castling=None, ep_square=None):
+        # Build a position from an 8x8 list of Piece objects and the game's
+        # castling rights and en passant square. Without castling rights every
+        # king and rook on its starting square is taken to be unmoved.
+        position = cls()
+        position.side = COLOUR_INDEX.get(side, side)
+        position.ep_square = ep_square
+        for row in range(8):
+            for col in range(8):
+                piece = board[row][col]
+                if piece is None:
+                    continue
+                position.put(square(row, col), piece_code(piece))
+        position.castling = board_castling(board) if castling is None else castling
+        position.refresh()
+        return position
+
+    def copy(self):
+        position = Position.__new__(Position)
+        position.pieces = self.pieces[:]
+        position.occupied = self.occupied[:]
+        position.squares = self.squares[:]
+        position.side = self.side
+        position.castling = self.castling
+        position.ep_square = self.ep_square
+        position.undo_stack = self.undo_stack[:]
+        position.attacks = self.attacks[:]
+        position.attack_maps = self.attack_maps[:]
+        position.key = self.key
+        return position
+
+    def put(self, sq, code):
+        bit = 1 << sq
+        self.pieces[code] |= bit
+        self.occupied[code // 6] |= bit
+        self.squares[sq] = code
+
+    def remove(self, sq):
+        code = self.squares[sq]
+        bit = 1 << sq
+        self.pieces[code] ^= bit
+        self.occupied[code // 6] ^= bit
+        self.squares[sq] = None
+        return code
+
+    def refresh(self):
+        # Rebuild the attack sets and the hash from scratch, needed after
+        # setting up a position with put()/remove()
+        occupied = self.occupied[0] | self.occupied[1]
+        squares = self.squares
+        self.attacks = [0 if code is None else piece_attacks(sq, code, occupied) for sq, code in enumerate(squares)]
+        self.attack_maps = [self._attack_map(WHITE), self._attack_map(BLACK)]
+        self.key = position_key(self)
+
+    def _attack_map(self, colour):
+        attacks = self.attacks
+        attack_map = 0
+        own = self.occupied[colour]
+        while own:
+            low = own & -own
+            attack_map |= attacks[low.bit_length() - 1]
+            own ^= low
+        return attack_map
+
+    def _update_attacks(self, changed):
+        # Recompute the attack sets of the changed squares and of every
+        # slider whose rays reach one of them; nothing else can be affected.
+        # Returns the old values for unmake().
+        attacks = self.attacks
+        squares = self.squares
+        pieces = self.pieces
+        occupied = self.occupied[0] | self.occupied[1]
+        saved = []
+        sliders = (pieces[BISHOP] | pieces[ROOK] | pieces[QUEEN]
+                   | pieces[6 + BISHOP] | pieces[6 + ROOK] | pieces[6 + QUEEN]) & ~changed
+        while sliders:
+            low = sliders & -sliders
+            sq = low.bit_length() - 1
+            sliders ^= low
+            if attacks[sq] & changed:
+                saved.append((sq, attacks[sq]))
+                attacks[sq] = piece_attacks(sq, squares[sq], occupied)
+        while changed:
+            low = changed & -changed
+            sq = low.bit_length() - 1
+            changed ^= low
+            saved.append((sq, attacks[sq]))
+            code = squares[sq]
+            attacks[sq] = 0 if code is None else piece_attacks(sq, code, occupied)
+        old_maps = self.attack_maps
+        self.attack_maps = [self._attack_map(WHITE), self._attack_map(BLACK)]
+        return saved, old_maps
+
+    def piece_at(self, sq):
+        # (colour, piece type) on the square or None
+        code = self.squares[sq]
+        if code is None:
+            return None
+        return divmod(code, 6)
+
+    def king_square(self, colour):
+        king = self.pieces[colour * 6 + KING]
+        return king.bit_length() - 1 if king else None
+
+    def attackers(self, sq, by):
+        # Bitboard of the pieces of colour `by` attacking the square
+        pieces = self.pieces
+        base = by * 6
+        occupied = self.occupied[0] | self.occupied[1]
+        diagonal = pieces[base + BISHOP] | pieces[base + QUEEN]
+        straight = pieces[base + ROOK] | pieces[base + QUEEN]
+        return ((KNIGHT_ATTACKS[sq] & pieces[base + KNIGHT])
+                | (KING_ATTACKS[sq] & pieces[base + KING])
+                | (PAWN_ATTACKS[by ^ 1][sq] & pieces[base + PAWN])
+                | (bishop_attacks(sq, occupied) & diagonal)
+                | (rook_attacks(sq, occupied) & straight))
+
+    def is_attacked(self, sq, by):
+        return bool(self.attack_maps[by] >> sq & 1)
+
+    def in_check(self, colour):
+        return bool(self.attack_maps[colour ^ 1] & self.pieces[colour * 6 + KING])
+
+    def is_valid_piece_move(self, piece_type, colour, start, end):
+        # Movement rules of a single piece type, ignoring what stands on the
+        # start square and whether the mover would be left in check.
+        occupied = self.occupied[0] | self.occupied[1]
+        target = 1 << end
+        if piece_type == PAWN:
+            forward = 8 if colour == WHITE else -8
+            if end == start + forward:
+                return not occupied & target
+            if end == start + 2 * forward and start >> 3 == (1 if colour == WHITE else 6):
+                return not occupied & (target | 1 << (start + forward))
+            if PAWN_ATTACKS[colour][start] & target:
+                return bool(self.occupied[colour ^ 1] & target) or end == self.ep_square
+            return False
+        if piece_type == KNIGHT:
+            return bool(KNIGHT_ATTACKS[start] & target)
+        if piece_type == BISHOP:
+            return bool(bishop_attacks(start, occupied) & target)
+        if piece_type == ROOK:
+            return bool(rook_attacks(start, occupied) & target)
+        if piece_type == QUEEN:
+            return bool((bishop_attacks(start, occupied) | rook_attacks(start, occupied)) & target)
+        if KING_ATTACKS[start] & target:
+            return True
+        # Castling
+        for right, king_sq, king_to, rook_sq in CASTLING:
+            if start == king_sq and end == king_to and self.castling & right:
+                return not occupied & BETWEEN[king_sq][rook_sq]
+        return False
+
+    def is_valid_move(self, start, end, colour):
+        code = self.squares[start]
+        if code is None or code // 6 != colour:
+            return False
+        if self.occupied[colour] & (1 << end):
+            return False
+        return self.is_valid_piece_move(code % 6, colour, start, end)
+
+    def make(self, move):
+        # Play a move produced by engine.movegen. Everything unmake() needs
+        # that cannot be read back off the move goes on the undo stack.
+        from_sq = move & 63
+        to_sq = move >> 6 & 63
+        flag = move >> 12
+        side = self.side
+        pieces = self.pieces
+        changed = 1 << from_sq | 1 << to_sq
+        key = self.key ^ SIDE_KEY ^ CASTLING_KEYS[self.castling] ^ ep_key(self.ep_square, side, pieces[side * 6 + PAWN])
+        captured = None
+        if flag == EP_CAPTURE:
+            victim = to_sq - 8 if side == WHITE else to_sq + 8
+            captured = self.remove(victim)
+            changed |= 1 << victim
+            key ^= PIECE_KEYS[captured][victim]
+        elif flag & CAPTURE:
+            captured = self.remove(to_sq)
+            key ^= PIECE_KEYS[captured][to_sq]
+        code = self.remove(from_sq)
+        placed = side * 6 + KNIGHT + (flag & 3) if flag & PROMOTION else code
+        self.put(to_sq, placed)
+        key ^= PIECE_KEYS[code][from_sq] ^ PIECE_KEYS[placed][to_sq]
+        if flag == KING_CASTLE or flag == QUEEN_CASTLE:
+            rook_from, rook_to = (to_sq + 1, to_sq - 1) if flag == KING_CASTLE else (to_sq - 2, to_sq + 1)
+            rook = self.remove(rook_from)
+            self.put(rook_to, rook)
+            changed |= 1 << rook_from | 1 << rook_to
+            key ^= PIECE_KEYS[rook][rook_from] ^ PIECE_KEYS[rook][rook_to]
+        saved, old_maps = self._update_attacks(changed)
+        self.undo_stack.append((move, code, captured, self.castling, self.ep_square, saved, old_maps, self.key))
+        self.castling &= CASTLING_KEPT[from_sq] & CASTLING_KEPT[to_sq]
+        self.ep_square = (from_sq + to_sq) >> 1 if flag == DOUBLE_PUSH else None
+        self.side = side ^ 1
+        self.key = (key ^ CASTLING_KEYS[self.castling]
+                    ^ ep_key(self.ep_square, side ^ 1, pieces[(side ^ 1) * 6 + PAWN]))
+
+    def make_null(self):
+        # Pass the move, used by the search to test for a null move cutoff
+        side = self.side
+        pieces = self.pieces
+        self.undo_stack.append((None, None, None, self.castling, self.ep_square, (), self.attack_maps, self.key))
+        self.key ^= SIDE_KEY ^ ep_key(self.ep_square, side, pieces[side * 6 + PAWN])
+        self.ep_square = None
+        self.side = side ^ 1
+
+    def unmake_null(self):
+        _, _, _, self.castling, self.ep_square, _, self.attack_maps, self.key = self.undo_stack.pop()
+        self.side ^= 1
+
+    def unmake(self):
+        (move, code, captured, self.castling, self.ep_square,
+         saved, self.attack_maps, self.key) = self.undo_stack.pop()
+        self.side ^= 1
+        attacks = self.attacks
+        for sq, sq_attacks in saved:
+            attacks[sq] = sq_attacks
+        from_sq = move & 63
+        to_sq = move >> 6 & 63
+        flag = move >> 12
+        self.remove(to_sq)
+        self.put(from_sq, code)
+        if flag == KING_CASTLE:
+            self.put(to_sq + 1, self.remove(to_sq - 1))
+        elif flag == QUEEN_CASTLE:
+            self.put(to_sq - 2, self.remove(to_sq + 1))
+        if flag == EP_CAPTURE:
+            self.put(to_sq - 8 if self.side == WHITE else to_sq + 8, captured)
+        elif captured is not None:
+            self.put(to_sq, captured)
+        return move
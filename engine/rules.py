@@ -0,0 +1,466 @@
+from array import array
+
+from engine.bitboard import COLOUR_INDEX, COLOURS, PIECE_TYPES, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, square
+from engine.fen import board_from_fen, board_to_fen
+from engine.movegen import has_legal_move, legal_moves
+from engine.move import QUIET, DOUBLE_PUSH, KING_CASTLE, QUEEN_CASTLE, CAPTURE, EP_CAPTURE, PROMOTION, encode, move_from, move_to
+from engine.position import (
+    Position, CASTLING_KEPT, WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE,
+    piece_code, board_castling, board_state_key,
+)
+from engine.zobrist import PIECE_KEYS, SIDE_KEY
+
+# Rules of the 8x8 list board of Piece objects the GUI (chess.py) and the CLI
+# (main.py) play on. Nothing here touches pygame or module globals, a game's
+# state lives in a Game object. Checks are read off the Position a Game
+# keeps in step with its board (Position.in_check), not the list board.
+
+# Castling right of a king move two squares along its rank, by colour and
+# direction
+CASTLING_RIGHTS = {
+    ('WHITE', 1): WHITE_KINGSIDE, ('WHITE', -1): WHITE_QUEENSIDE,
+    ('BLACK', 1): BLACK_KINGSIDE, ('BLACK', -1): BLACK_QUEENSIDE,
+}
+
+
+class Piece:
+    # Pieces are flyweights: Piece('WHITE', 'P') always gives the same shared
+    # object, which cannot be changed. Whether a king or rook may still castle
+    # and which pawn may be taken en passant is position state, kept by Game.
+    # code is the piece's engine.position code, colour * 6 + type.
+    __slots__ = ('colour', 'piece_type', 'code')
+    _shared = {}
+
+    def __new__(cls, colour, piece_type):
+        piece = cls._shared.get((colour, piece_type))
+        if piece is None:
+            piece = object.__new__(cls)
+            object.__setattr__(piece, 'colour', colour)
+            object.__setattr__(piece, 'piece_type', piece_type)
+            object.__setattr__(piece, 'code', COLOUR_INDEX[colour] * 6 + PIECE_TYPES.index(piece_type))
+            cls._shared[(colour, piece_type)] = piece
+        return piece
+
+    def __setattr__(self, name, value):
+        raise AttributeError("pieces are shared and cannot be changed")
+
+    def __reduce__(self):
+        # Copies and pickles come back as the shared piece
+        return Piece, (self.colour, self.piece_type)
+
+    def __repr__(self):
+        return f"{self.colour} {self.piece_type}"
+
+    def __str__(self):
+        colour_symbol = 'W' if self.colour == 'WHITE' else 'B'
+        return f"{colour_symbol}{self.piece_type}"
+
+    def is_valid_rook_move(self, board, start, end):
+        if isinstance(board, Position):
+            return board.is_valid_piece_move(ROOK, COLOUR_INDEX[self.colour], square(*start), square(*end))
+        # Check if the move is valid for a rook
+        start_row, start_col = start
+        end_row, end_col = end
+        if start_col == end_col:
+            step = 1 if end_row > start_row else -1
+            for row in range(start_row + step, end_row, step):
+                if isinstance(board[row][start_col], Piece):
+                    return False
+            return True
+        elif start_row == end_row:
+            step = 1 if end_col > start_col else -1
+            for col in range(start_col + step, end_col, step):
+                if isinstance(board[start_row][col], Piece):
+                    return False
+            return True
+        return False
+
+    def is_valid_bishop_move(self, board, start, end):
+        if isinstance(board, Position):
+            return board.is_valid_piece_move(BISHOP, COLOUR_INDEX[self.colour], square(*start), square(*end))
+        # Check if the move is valid for a bishop
+        start_row, start_col = start
+        end_row, end_col = end
+        if abs(end_col - start_col) == abs(end_row - start_row):
+            step_row = 1 if end_row > start_row else -1
+            step_col = 1 if end_col > start_col else -1
+            row, col = start_row + step_row, start_col + step_col
+
+            for _ in range(abs(end_row - start_row)-1):
+                if isinstance(board[row][col], Piece):
+                    return False
+                row += step_row
+                col += step_col
+            return True
+        return False
+
+    def is_valid_queen_move(self, board, start, end):
+        if isinstance(board, Position):
+            return board.is_valid_piece_move(QUEEN, COLOUR_INDEX[self.colour], square(*start), square(*end))
+        return self.is_valid_bishop_move(board, start, end) or self.is_valid_rook_move(board, start, end)
+
+    def is_valid_knight_move(self, start, end):
+        start_row, start_col = start
+        end_row, end_col = end
+
+        step_row = abs(start_row - end_row)
+        step_col = abs(start_col - end_col)
+
+        return (step_row, step_col) in [(2,1),(1,2)]
+
+    def is_valid_king_move(self, board, start, end, castling = 0):
+        if isinstance(board, Position):
+            return board.is_valid_piece_move(KING, COLOUR_INDEX[self.colour], square(*start), square(*end))
+        start_row, start_col = start
+        end_row, end_col = end
+
+        step_row = abs(start_row - end_row)
+        step_col = abs(start_col - end_col)
+
+        if (step_row, step_col) in [(0,1),(1,0),(1,1)]:
+            return True
+
+        # Castling, with the right for that side still held
+        if step_col == 2 and step_row == 0:
+            direction = [0, -1] if start_col > end_col else [7, 1]
+            if not castling & CASTLING_RIGHTS[(self.colour, direction[1])]:
+                return False
+            rook = board[start_row][direction[0]]
+            if rook and rook.piece_type == 'R' and rook.colour == self.colour:
+                x = start_col + direction[1]
+                for i in range(x, direction[0], direction[1]):
+                    if isinstance(board[start_row][i], Piece):
+                        return False
+                return True
+        return False
+
+    def is_pawn_valid_move(self, board, start, end, ep_square = None):
+        if isinstance(board, Position):
+            return board.is_valid_piece_move(PAWN, COLOUR_INDEX[self.colour], square(*start), square(*end))
+        start_row, start_col = start
+        end_row, end_col = end
+        target_piece = board[end_row][end_col]
+
+        direction = 1 if self.colour == "WHITE" else -1
+        start_row_limit = 1 if self.colour == "WHITE" else 6
+
+        if start_col == end_col:
+            # one move forward
+            if end_row == start_row + direction and board[end_row][end_col] is None:
+                return True
+
+            # Two move forward from starting row
+            if start_row == start_row_limit and end_row == start_row + 2 * direction:
+                if board[start_row + direction][start_col] is None and board[end_row][end_col] is None:
+                    return True
+
+        # Diagonal capture
+        if end_row == start_row + direction and abs(end_col - start_col) == 1:
+            if target_piece is not None and target_piece.colour != self.colour:
+                return True
+            # en-passant onto the square the last move's double step passed
+            if ep_square is not None and square(end_row, end_col) == ep_square:
+                return True
+
+
+def create_board():
+    board = [[None for _ in range(8)] for _ in range(8)]
+    for i in range(8):
+        board[1][i] = Piece('WHITE', 'P')
+        board[6][i] = Piece('BLACK', 'P')
+
+    placement = [('R', 0), ('N', 1), ('B', 2), ('Q', 3), ('K', 4), ('B', 5), ('N', 6), ('R', 7)]
+    for piece, col in placement:
+        board[0][col] = Piece('WHITE', piece)
+        board[7][col] = Piece('BLACK', piece)
+    return board
+
+
+def print_board(board):
+    for i, row in enumerate(board[::-1]):
+        print(8 - i, end=" ")
+        print("  |  ".join(str(piece) if piece else "__" for piece in row))
+    print("  a      b      c      d      e      f      g      h")
+
+
+def is_valid_move(start, end, colour, board, castling = 0, ep_square = None):
+    # castling holds the rights still open and ep_square the square a pawn
+    # passed in a double step last move, as in engine.position
+    if isinstance(board, Position):
+        return board.is_valid_move(square(*start), square(*end), COLOUR_INDEX[colour])
+    start_row, start_col = start
+    end_row, end_col = end
+    piece = board[start_row][start_col]
+    target_piece = board[end_row][end_col]
+
+    if piece is None:
+        return False
+
+    # Example validation: check if the move is within bounds and not capturing own piece
+    if not (0 <= end_row < 8 and 0 <= end_col < 8):
+        return False
+
+    if colour != piece.colour:
+        return False
+
+    if target_piece is not None and target_piece.colour == piece.colour:
+        return False
+
+    # Additional rules for specific pieces can be added here
+    # Pawn
+    if piece.piece_type == 'P':
+        return piece.is_pawn_valid_move(board, start, end, ep_square)
+    # Rook
+    elif piece.piece_type == 'R':
+        return piece.is_valid_rook_move(board, start, end)
+    # Bishop
+    elif piece.piece_type == 'B':
+        return piece.is_valid_bishop_move(board, start, end)
+    # Queen
+    elif piece.piece_type == 'Q':
+        return piece.is_valid_queen_move(board, start, end)
+    # Knight
+    elif piece.piece_type == 'N':
+        return piece.is_valid_knight_move(start, end)
+    # King
+    elif piece.piece_type == 'K':
+        return piece.is_valid_king_move(board, start, end, castling)
+    return False
+
+
+class Game:
+    # One game on a list board: the pieces, the side to move ('WHITE' or
+    # 'BLACK'), the castling rights and en passant square, the captured
+    # pieces, the undo records, the
+    # moves played as 16-bit engine.move ints and the Zobrist key of the
+    # position, which make_move keeps up to date. make_move also plays each
+    # move on a bitboard copy of the game, which answers whether the side to
+    # move has any move left, and keeps the key of every position reached for
+    # spotting repetitions.
+    def __init__(self, fen = None):
+        if fen is None:
+            self.board, self.side = create_board(), 'WHITE'
+            self.castling, self.ep_square = board_castling(self.board), None
+            counters = []
+        else:
+            self.board, self.side, self.castling, self.ep_square = board_from_fen(fen, Piece)
+            counters = fen.split()[4:6]
+        self.white_captured = []
+        self.black_captured = []
+        # Undo records of the moves played, newest last
+        self.undo_stack = []
+        self.moves = array('H')
+        self.bitboards = self.position()
+        self.key = self.bitboards.key
+        # Keys of the positions so far, the current one last
+        self.history = [self.key]
+        # Plies since the last capture or pawn move, for the fifty-move rule,
+        # and since the last move no position before it can come back after:
+        # one of those or a change of castling rights
+        self.halfmove = int(counters[0]) if counters else 0
+        # The moves before a FEN are unknown, so repetitions count from it
+        self.reversible = 0
+        # Plies played before the game's first position, from its move number
+        self.start_ply = 2 * (int(counters[1]) - 1 if len(counters) > 1 else 0) + (self.side == 'BLACK')
+        # King square of the side to move when it is in check, else None
+        self.checked_king = self.find_checked_king()
+        # How the game ended, see game_over, or None while it goes on
+        self.outcome = self.game_over()
+        # Legal moves by start square and the key of the position they are for
+        self.destinations = {}
+        self.destinations_key = None
+
+    def position(self):
+        # The game as a bitboard Position, for the search and move generator
+        return Position.from_board(self.board, self.side, self.castling, self.ep_square)
+
+    def fen(self):
+        return board_to_fen(self.board, self.side, self.castling, self.ep_square,
+                            self.halfmove, (self.start_ply + len(self.moves)) // 2 + 1)
+
+    def is_valid_move(self, start, end):
+        return is_valid_move(start, end, self.side, self.board, self.castling, self.ep_square)
+
+    def is_under_check(self, colour = None):
+        return self.bitboards.in_check(COLOUR_INDEX[colour or self.side])
+
+    def find_checked_king(self):
+        # (row, col) of the side to move's king when it is in check, read
+        # off the bitboards rather than by walking the list board
+        colour = COLOUR_INDEX[self.side]
+        if self.bitboards.in_check(colour):
+            return divmod(self.bitboards.king_square(colour), 8)
+        return None
+
+    def has_legal_move(self):
+        return has_legal_move(self.bitboards)
+
+    def repetitions(self):
+        # Times the position was reached before. Only positions with the same
+        # side to move since the last irreversible move can match.
+        history = self.history
+        key = self.key
+        last = len(history) - 1
+        count = 0
+        for ply in range(last - 2, last - self.reversible - 1, -2):
+            if history[ply] == key:
+                count += 1
+        return count
+
+    def game_over(self):
+        # 'checkmate' or 'stalemate' when the side to move cannot move, the
+        # draws 'fifty-move' after fifty moves each without a capture or pawn
+        # move and 'repetition' when the position is on the board for the
+        # third time, else None
+        if not has_legal_move(self.bitboards):
+            return 'checkmate' if self.checked_king else 'stalemate'
+        if self.halfmove >= 100:
+            return 'fifty-move'
+        # It takes eight plies to get back to a position twice
+        if self.reversible >= 8 and self.repetitions() >= 2:
+            return 'repetition'
+        return None
+
+    def legal_destinations(self, start):
+        # Squares the piece on start can legally move to, as (row, col). The
+        # position's moves are all generated by the first call and kept until
+        # the position changes, so later calls are a lookup.
+        if self.destinations_key != self.key:
+            destinations = {}
+            for move in legal_moves(self.bitboards):
+                destinations.setdefault(divmod(move_from(move), 8), set()).add(divmod(move_to(move), 8))
+            self.destinations = destinations
+            self.destinations_key = self.key
+        return self.destinations.get(start, frozenset())
+
+    def is_promotion(self, start, end):
+        # True when the move takes a pawn to the last rank, so the front end
+        # has to ask which piece it becomes before calling make_move
+        piece = self.board[start[0]][start[1]]
+        return piece is not None and piece.piece_type == 'P' and end[0] in (0, 7)
+
+    def is_legal_move(self, start, end):
+        # Try the move and take it back
+        if self.make_move(start, end):
+            self.unmake_move()
+            return True
+        return False
+
+    def make_move(self, start, end, promotion = None, legal = False):
+        # Play a move for the side to move, False when it is not legal. A
+        # pawn reaching the last rank becomes a queen unless promotion names
+        # another piece type. Prints nothing either way, the front ends
+        # report the outcome. legal skips the rule checks for a move the
+        # caller already knows is legal, from legal_destinations or the
+        # engine.
+        board = self.board
+        start_row, start_col = start
+        end_row, end_col = end
+        piece = board[start_row][start_col]
+        player = self.side
+
+        if legal or self.is_valid_move(start, end):
+            captured_at = end
+            rook_move = None
+            colour = COLOUR_INDEX[player]
+            key = self.key ^ board_state_key(board, colour, self.castling, self.ep_square)
+
+            # For en_passant
+            if piece.piece_type == 'P' and abs(start_col - end_col) == 1 and board[end_row][end_col] is None:
+                captured_at = (start_row, end_col)
+            # Castling
+            if piece.piece_type == 'K' and abs(start_col - end_col) == 2:
+                # [rook column, rook end pos right or left of king, direction king will take]
+                direction = [0, 1, -1] if start_col > end_col else [7, -1, 1]
+                # Not out of check or through an attacked square, the
+                # bitboards still hold the position before the move
+                if not legal and self.bitboards.attack_maps[colour ^ 1] & (
+                        1 << square(*start) | 1 << square(start_row, start_col + direction[2])):
+                    return False
+                rook = board[start_row][direction[0]]
+                rook_move = ((start_row, direction[0]), (start_row, end_col + direction[1]))
+                key ^= PIECE_KEYS[piece_code(rook)][square(*rook_move[0])] ^ PIECE_KEYS[piece_code(rook)][square(*rook_move[1])]
+                board[start_row][end_col + direction[1]] = rook
+                board[start_row][direction[0]] = None
+            # Move Piece
+            captured = board[captured_at[0]][captured_at[1]]
+            if captured is not None:
+                key ^= PIECE_KEYS[piece_code(captured)][square(*captured_at)]
+                if captured.colour == "WHITE":
+                    self.white_captured.append(captured)
+                else :
+                    self.black_captured.append(captured)
+                board[captured_at[0]][captured_at[1]] = None
+            board[end_row][end_col] = piece
+            board[start_row][start_col] = None
+            key ^= PIECE_KEYS[piece_code(piece)][square(*start)] ^ PIECE_KEYS[piece_code(piece)][square(*end)]
+            self.undo_stack.append((piece, start, end, captured, captured_at, rook_move,
+                                    self.castling, self.ep_square, self.key, self.checked_king, self.outcome,
+                                    self.halfmove, self.reversible))
+
+            # A king or rook leaving its square, or a rook taken on it, ends
+            # those castling rights. Only a double step leaves an en passant
+            # square.
+            castling = self.castling
+            self.castling &= CASTLING_KEPT[square(*start)] & CASTLING_KEPT[square(*end)]
+            double_step = piece.piece_type == 'P' and abs(end_row - start_row) == 2
+            self.ep_square = square((start_row + end_row) // 2, start_col) if double_step else None
+            # Pawn reached Promotion Square
+            if piece.piece_type == 'P' and (end_row == 7 or end_row == 0):
+                if promotion is None:
+                    promotion = 'Q'
+                board[end_row][end_col] = Piece(piece.colour, promotion)
+                key ^= PIECE_KEYS[piece_code(piece)][square(*end)] ^ PIECE_KEYS[piece_code(board[end_row][end_col])][square(*end)]
+            self.key = key ^ SIDE_KEY ^ board_state_key(board, colour ^ 1, self.castling, self.ep_square)
+            self.side = COLOURS[colour ^ 1]
+            if rook_move:
+                flag = KING_CASTLE if end_col > start_col else QUEEN_CASTLE
+            elif captured_at != end:
+                flag = EP_CAPTURE
+            elif double_step:
+                flag = DOUBLE_PUSH
+            else:
+                flag = CAPTURE if captured is not None else QUIET
+            if board[end_row][end_col] is not piece:
+                flag |= PROMOTION | PIECE_TYPES.index(promotion) - KNIGHT
+            move = encode(square(*start), square(*end), flag)
+            self.moves.append(move)
+            self.bitboards.make(move)
+            self.history.append(self.key)
+            if piece.piece_type == 'P' or captured is not None:
+                self.halfmove = self.reversible = 0
+            else:
+                self.halfmove += 1
+                self.reversible = self.reversible + 1 if castling == self.castling else 0
+
+            if not legal and self.bitboards.in_check(colour):
+                self.unmake_move()
+                return False
+            self.checked_king = self.find_checked_king()
+            self.outcome = self.game_over()
+        else:
+            return False
+        return True
+
+    def unmake_move(self):
+        # Take back the last move make_move played, using its undo record
+        board = self.board
+        (piece, start, end, captured, captured_at, rook_move,
+         self.castling, self.ep_square, self.key, self.checked_king, self.outcome,
+         self.halfmove, self.reversible) = self.undo_stack.pop()
+        self.moves.pop()
+        self.bitboards.unmake()
+        self.history.pop()
+        board[end[0]][end[1]] = None
+        board[start[0]][start[1]] = piece
+        if captured is not None:
+            board[captured_at[0]][captured_at[1]] = captured
+            if captured.colour == "WHITE":
+                self.white_captured.pop()
+            else:
+                self.black_captured.pop()
+        if rook_move:
+            (rook_row, rook_col), (to_row, to_col) = rook_move
+            board[rook_row][rook_col] = board[to_row][to_col]
+            board[to_row][to_col] = None
+        self.side = piece.colour
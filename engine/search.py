@@ -0,0 +1,315 @@
+import argparse
+import sys
+import time
+
+from engine.bitboard import WHITE, BLACK, PAWN, popcount
+from engine.evaluate import PIECE_VALUES, evaluate, only_pawns
+from engine.fen import START_FEN, position_from_fen
+from engine.move import CAPTURE, PROMOTION, move_to_uci
+from engine.movegen import legal_moves
+from engine.tablebase import Tablebases
+from engine.tt import EXACT, LOWER, UPPER, TranspositionTable
+
+MATE = 100000
+INFINITY = 1000000
+MAX_PLY = 64
+# Scores within this of MATE are mates. Tablebase wins are scored from the
+# table's distance to mate, which is kept in a byte and can be far longer
+# than the search goes (66 plies in KBNK), so the window is wider than
+# MAX_PLY.
+MATE_WINDOW = 1024
+# How often, in nodes, the clock is looked at
+CHECK_EVERY = 256
+DELTA_MARGIN = 200
+# Transposition table size used when the caller does not pass a table
+DEFAULT_HASH_MB = 16
+
+
+def score_to_tt(score, ply):
+    # Mate scores are stored as distance from the node rather than the root
+    if score >= MATE - MATE_WINDOW:
+        return score + ply
+    if score <= -MATE + MATE_WINDOW:
+        return score - ply
+    return score
+
+
+def score_from_tt(score, ply):
+    if score >= MATE - MATE_WINDOW:
+        return score - ply
+    if score <= -MATE + MATE_WINDOW:
+        return score + ply
+    return score
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class SearchResult:
+    def __init__(self, move, score, depth, nodes, elapsed, pv):
+        self.move = move
+        self.score = score
+        self.depth = depth
+        self.nodes = nodes
+        self.elapsed = elapsed
+        self.pv = pv
+
+    @property
+    def nps(self):
+        return int(self.nodes / self.elapsed) if self.elapsed > 0 else 0
+
+    def __str__(self):
+        pv = ' '.join(move_to_uci(move) for move in self.pv)
+        return (f"depth {self.depth} score {self.score} nodes {self.nodes} "
+                f"nps {self.nps} time {self.elapsed:.3f} pv {pv}")
+
+
+class Search:
+    # Iterative deepening alpha-beta (principal variation search) with a
+    # quiescence search, null move pruning, check extension, a transposition
+    # table and move ordering by previous PV or hash move, MVV-LVA, killers
+    # and history. The position is searched in place and left as it was found.
+    # Pass the same table to later searches to keep what it learned. stop is
+    # an optional event that ends the search early once set, and start_depth
+    # lets a helper of a parallel search skip the shallow iterations. With
+    # tablebases (engine.tablebase) positions they cover are looked up
+    # instead of searched.
+    def __init__(self, position, time_limit=1.0, max_depth=MAX_PLY, report=None, tt=None,
+                 stop=None, start_depth=1, tablebases=None):
+        self.position = position
+        self.tt = tt if tt is not None else TranspositionTable(DEFAULT_HASH_MB)
+        self.time_limit = time_limit
+        self.max_depth = min(max_depth, MAX_PLY - 1)
+        self.start_depth = min(start_depth, self.max_depth)
+        self.stop = stop
+        self.tablebases = tablebases
+        # Called with a SearchResult after every completed depth
+        self.report = report
+        self.nodes = 0
+        self.deadline = None
+        self.killers = [[0, 0] for _ in range(MAX_PLY + 1)]
+        self.history = [0] * 4096
+        self.pv = [[] for _ in range(MAX_PLY + 1)]
+        self.previous_pv = []
+        self.root_best = None
+
+    def run(self):
+        position = self.position
+        start = time.perf_counter()
+        self.deadline = start + self.time_limit
+        self.tt.new_search()
+        moves = legal_moves(position)
+        if not moves:
+            score = -MATE if position.in_check(position.side) else 0
+            return SearchResult(None, score, 0, 0, 0.0, [])
+        found = self.tablebases.best_move(position) if self.tablebases is not None else None
+        if found is not None:
+            move, wdl, plies = found
+            score = 0 if not wdl else (MATE - plies if wdl > 0 else -MATE + plies)
+            return SearchResult(move, score, 0, 0, time.perf_counter() - start, [move])
+        best = SearchResult(moves[0], 0, 0, 0, 0.0, [moves[0]])
+        stack_size = len(position.undo_stack)
+        try:
+            for depth in range(self.start_depth, self.max_depth + 1):
+                self.root_best = None
+                score = self.negamax(depth, -INFINITY, INFINITY, 0, True, True)
+                self.previous_pv = self.pv[0][:]
+                elapsed = time.perf_counter() - start
+                best = SearchResult(self.previous_pv[0], score, depth, self.nodes, elapsed, self.previous_pv)
+                if self.report:
+                    self.report(best)
+                # Stop early on a forced mate, an only move, or when the next
+                # depth could not finish in the time left
+                if abs(score) >= MATE - MATE_WINDOW or len(moves) == 1 or elapsed * 2 > self.time_limit:
+                    break
+        except SearchTimeout:
+            while len(position.undo_stack) > stack_size:
+                if position.undo_stack[-1][0] is None:
+                    position.unmake_null()
+                else:
+                    position.unmake()
+            if self.root_best is not None:
+                # A root move that raised alpha at the unfinished depth is at
+                # least as good as the last completed depth's choice
+                move, score, pv = self.root_best
+                best = SearchResult(move, score, best.depth, 0, 0.0, pv)
+        best.nodes = self.nodes
+        best.elapsed = time.perf_counter() - start
+        return best
+
+    def check_time(self):
+        if time.perf_counter() > self.deadline or (self.stop is not None and self.stop.is_set()):
+            raise SearchTimeout
+
+    def order(self, moves, ply, pv_move):
+        squares = self.position.squares
+        killers = self.killers[ply]
+        history = self.history
+
+        def score(move):
+            if move == pv_move:
+                return 1 << 30
+            flag = move >> 12
+            if flag & CAPTURE:
+                victim = squares[move >> 6 & 63]
+                victim_value = PIECE_VALUES[victim % 6] if victim is not None else PIECE_VALUES[PAWN]
+                return (1 << 24) + victim_value * 16 - PIECE_VALUES[squares[move & 63] % 6] // 16
+            if flag & PROMOTION:
+                return 1 << 23
+            if move == killers[0]:
+                return 1 << 22
+            if move == killers[1]:
+                return (1 << 22) - 1
+            return history[move & 4095]
+        moves.sort(key=score, reverse=True)
+
+    def negamax(self, depth, alpha, beta, ply, on_pv, allow_null):
+        self.nodes += 1
+        if not self.nodes % CHECK_EVERY:
+            self.check_time()
+        position = self.position
+        self.pv[ply] = []
+        in_check = position.in_check(position.side)
+        if in_check:
+            depth += 1
+        if depth <= 0:
+            return self.quiesce(alpha, beta, ply)
+        if ply >= MAX_PLY - 1:
+            return evaluate(position)
+        if (ply and self.tablebases is not None
+                and popcount(position.occupied[WHITE] | position.occupied[BLACK]) <= 4):
+            found = self.tablebases.probe(position)
+            if found is not None:
+                wdl, plies = found
+                return 0 if not wdl else (MATE - ply - plies if wdl > 0 else -MATE + ply + plies)
+
+        tt = self.tt
+        alpha_start = alpha
+        entry = tt.probe(position.key)
+        hash_move = 0
+        if entry is not None:
+            hash_move, tt_score, tt_depth, bound = entry
+            if not on_pv and tt_depth >= depth:
+                tt_score = score_from_tt(tt_score, ply)
+                if (bound == EXACT or (bound == LOWER and tt_score >= beta)
+                        or (bound == UPPER and tt_score <= alpha)):
+                    return tt_score
+
+        if (allow_null and not on_pv and not in_check and depth >= 3
+                and not only_pawns(position, position.side) and evaluate(position) >= beta):
+            position.make_null()
+            score = -self.negamax(depth - 3, -beta, -beta + 1, ply + 1, False, False)
+            position.unmake_null()
+            if score >= beta:
+                return beta
+
+        moves = legal_moves(position)
+        if not moves:
+            return -MATE + ply if in_check else 0
+        pv_move = self.previous_pv[ply] if on_pv and ply < len(self.previous_pv) else 0
+        self.order(moves, ply, pv_move or hash_move)
+
+        best = -INFINITY
+        best_move = 0
+        for index, move in enumerate(moves):
+            position.make(move)
+            if index == 0:
+                score = -self.negamax(depth - 1, -beta, -alpha, ply + 1, on_pv and move == pv_move, True)
+            else:
+                score = -self.negamax(depth - 1, -alpha - 1, -alpha, ply + 1, False, True)
+                if alpha < score < beta:
+                    score = -self.negamax(depth - 1, -beta, -alpha, ply + 1, False, True)
+            position.unmake()
+            if score > best:
+                best = score
+                best_move = move
+            if score > alpha:
+                alpha = score
+                self.pv[ply] = [move] + self.pv[ply + 1]
+                if ply == 0:
+                    self.root_best = (move, score, self.pv[0][:])
+                if score >= beta:
+                    if not move >> 12 & (CAPTURE | PROMOTION):
+                        killers = self.killers[ply]
+                        if killers[0] != move:
+                            killers[1] = killers[0]
+                            killers[0] = move
+                        self.history[move & 4095] += depth * depth
+                    break
+        if best >= beta:
+            bound = LOWER
+        elif best > alpha_start:
+            bound = EXACT
+        else:
+            bound = UPPER
+        tt.store(position.key, depth, score_to_tt(best, ply), bound, best_move)
+        return best
+
+    def quiesce(self, alpha, beta, ply):
+        self.nodes += 1
+        if not self.nodes % CHECK_EVERY:
+            self.check_time()
+        position = self.position
+        self.pv[ply] = []
+        if ply >= MAX_PLY - 1:
+            return evaluate(position)
+        if position.in_check(position.side):
+            # Every evasion has to be looked at, there is no standing pat
+            moves = legal_moves(position)
+            if not moves:
+                return -MATE + ply
+        else:
+            stand_pat = evaluate(position)
+            if stand_pat >= beta:
+                return stand_pat
+            if stand_pat > alpha:
+                alpha = stand_pat
+            moves = legal_moves(position, captures_only=True)
+            # Delta pruning, skip captures that cannot lift the score to alpha
+            # even with a margin for positional gains
+            squares = position.squares
+            margin = alpha - stand_pat - DELTA_MARGIN
+            if margin > 0:
+                moves = [move for move in moves
+                         if move >> 12 & PROMOTION or squares[move >> 6 & 63] is None
+                         or PIECE_VALUES[squares[move >> 6 & 63] % 6] > margin]
+        self.order(moves, ply, 0)
+        for move in moves:
+            position.make(move)
+            score = -self.quiesce(-beta, -alpha, ply + 1)
+            position.unmake()
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+
+def search(position, time_limit=1.0, max_depth=MAX_PLY, report=None, tt=None, tablebases=None):
+    return Search(position, time_limit, max_depth, report, tt, tablebases=tablebases).run()
+
+
+def main(argv=None):
+    # python -m engine.search [--time SECONDS] [--depth N] [fen]
+    parser = argparse.ArgumentParser(description="Search a position and print each completed depth")
+    parser.add_argument('--time', type=float, default=1.0, help="time budget in seconds")
+    parser.add_argument('--depth', type=int, default=MAX_PLY, help="maximum depth")
+    parser.add_argument('--hash', type=int, default=DEFAULT_HASH_MB, help="transposition table size in MB")
+    parser.add_argument('--tablebases', help="directory of engine.tablebase tables to use")
+    parser.add_argument('fen', nargs='*', help="position to search, the start position by default")
+    args = parser.parse_args(argv)
+    position = position_from_fen(' '.join(args.fen) if args.fen else START_FEN)
+    tt = TranspositionTable(args.hash)
+    tablebases = Tablebases(args.tablebases) if args.tablebases else None
+    result = search(position, args.time, args.depth, report=print, tt=tt, tablebases=tablebases)
+    print(f"bestmove {move_to_uci(result.move) if result.move else '(none)'} "
+          f"depth {result.depth} nodes {result.nodes} nps {result.nps}")
+    stats = tt.stats()
+    print(f"hash {stats['size_mb']:.0f} MB entries {stats['entries']} "
+          f"hit rate {stats['hit_rate']:.1%} occupancy {stats['occupancy']:.1%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
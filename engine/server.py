@@ -0,0 +1,193 @@
+import argparse
+import asyncio
+import re
+import sys
+
+from engine.bitboard import parse_square
+from engine.rules import Game
+
+# Hosts two player games over TCP, any number of them in one process. The
+# protocol is one line of text per message.
+#
+#   client                  server
+#   play                    wait                      no opponent yet
+#                           start <game> <colour> <fen>   to both players
+#   move <uci>              moved <uci> <check|-> <fen>   to both players
+#                           illegal <uci>
+#   fen                     fen <fen>
+#   resign                  over <game> <winner> resign   to both players
+#   (disconnect)            over <game> <winner> abandoned
+#                           over <game> <winner> checkmate  after the mating move
+#                           over <game> draw stalemate|repetition|fifty-move
+#                           error <text>
+#
+# Games live in memory as engine.rules Game objects. A move is checked on the
+# event loop itself: make_move takes a fraction of a millisecond, less than
+# handing it to a thread would cost, and it never waits on anything.
+
+DEFAULT_PORT = 8765
+# Bytes a player may leave unread before the server drops the connection
+MAX_UNREAD = 64 * 1024
+UCI = re.compile(r'([a-h][1-8])([a-h][1-8])([qrbn]?)$')
+
+
+class Player:
+    # One connection, and the game it is in
+    def __init__(self, writer):
+        self.writer = writer
+        self.table = None
+        self.colour = None
+
+    def send(self, text):
+        # Dropped once the player has left. Only the sender's own connection
+        # is drained, so one that stops reading what its opponent's moves
+        # send is cut off instead of buffering without end, and its game is
+        # then abandoned.
+        if self.writer is not None:
+            self.writer.write(text.encode() + b'\n')
+            if self.writer.transport.get_write_buffer_size() > MAX_UNREAD:
+                self.writer.transport.abort()
+                self.writer = None
+
+
+class Table:
+    # A game being played and its two players
+    def __init__(self, number, white, black):
+        self.number = number
+        self.game = Game()
+        self.players = {'WHITE': white, 'BLACK': black}
+
+    def send(self, text):
+        for player in self.players.values():
+            player.send(text)
+
+
+def parse_uci(text):
+    # e7e8q -> ((6, 4), (7, 4), 'Q') in list board (row, col) squares, None
+    # when the text is not a move
+    match = UCI.match(text)
+    if not match:
+        return None
+    start, end, promotion = match.groups()
+    return divmod(parse_square(start), 8), divmod(parse_square(end), 8), promotion.upper() or None
+
+
+class GameServer:
+    def __init__(self):
+        self.tables = {}
+        self.waiting = None
+        self.next_number = 1
+        self.moves = 0
+
+    def play(self, player):
+        if player.table is not None:
+            player.send("error already playing")
+        elif self.waiting is None or self.waiting is player:
+            self.waiting = player
+            player.send("wait")
+        else:
+            table = Table(self.next_number, self.waiting, player)
+            self.next_number += 1
+            self.waiting = None
+            self.tables[table.number] = table
+            fen = table.game.fen()
+            for colour, seated in table.players.items():
+                seated.table = table
+                seated.colour = colour
+                seated.send(f"start {table.number} {colour} {fen}")
+
+    def move(self, player, text):
+        table = player.table
+        if table is None:
+            player.send("error not playing")
+            return
+        game = table.game
+        if game.side != player.colour:
+            player.send("error not your turn")
+            return
+        move = parse_uci(text)
+        if move is None or not game.make_move(*move):
+            player.send(f"illegal {text}")
+            return
+        self.moves += 1
+        table.send(f"moved {text} {'check' if game.checked_king else '-'} {game.fen()}")
+        if game.outcome:
+            self.finish(table, player.colour if game.outcome == 'checkmate' else 'draw', game.outcome)
+
+    def finish(self, table, winner, reason):
+        table.send(f"over {table.number} {winner} {reason}")
+        for player in table.players.values():
+            player.table = None
+            player.colour = None
+        del self.tables[table.number]
+
+    def leave(self, player):
+        if self.waiting is player:
+            self.waiting = None
+        if player.table is not None:
+            loser = player.colour
+            player.writer = None
+            self.finish(player.table, 'BLACK' if loser == 'WHITE' else 'WHITE', 'abandoned')
+
+    async def serve(self, reader, writer):
+        player = Player(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                words = line.decode(errors='replace').split()
+                if not words:
+                    continue
+                command = words[0]
+                if command == 'play':
+                    self.play(player)
+                elif command == 'move' and len(words) == 2:
+                    self.move(player, words[1])
+                elif command == 'fen':
+                    if player.table is None:
+                        player.send("error not playing")
+                    else:
+                        player.send(f"fen {player.table.game.fen()}")
+                elif command == 'resign':
+                    if player.table is None:
+                        player.send("error not playing")
+                    else:
+                        self.finish(player.table, 'BLACK' if player.colour == 'WHITE' else 'WHITE', 'resign')
+                else:
+                    player.send(f"error unknown command {command}")
+                # Slow readers hold up their own connection, not the server
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            self.leave(player)
+            writer.close()
+
+
+async def run(host, port):
+    server = GameServer()
+    listener = await asyncio.start_server(server.serve, host, port, backlog=4096)
+    print(f"serving games on {host}:{port}")
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        print(f"{server.next_number - 1} games started, {len(server.tables)} open, {server.moves} moves")
+
+
+def main(argv=None):
+    # python -m engine.server [--host HOST] [--port PORT]
+    parser = argparse.ArgumentParser(description="Host chess games over TCP")
+    parser.add_argument('--host', default='127.0.0.1', help="address to listen on")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="port to listen on")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(run(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,544 @@
+import argparse
+import mmap
+import multiprocessing
+import os
+import struct
+import sys
+import time
+from array import array
+from multiprocessing import shared_memory
+
+from engine.bitboard import (
+    WHITE, BLACK, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, PIECE_TYPES,
+    KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, rook_attacks, bishop_attacks, popcount, squares,
+)
+from engine.fen import position_from_fen
+from engine.move import move_to_uci
+from engine.movegen import legal_moves
+
+# Endgame tablebases for a king and one or two pieces against a lone king,
+# built by retrograde analysis. Every position of a table gets its result
+# for the side to move (win, draw or loss) and the plies to mate.
+#
+# A table stores the side with the pieces as white; positions where black
+# has them are probed with the board mirrored. The white king is kept to
+# a1-d1-d4 (a1-d8 with a pawn) by the board's symmetries, and a position's
+# index is then plain arithmetic on its squares:
+#
+#   ((side * king squares + white king) * 64 + piece ...) * 64 + black king
+#
+# A table file is a header, the results at two bits a position, then the
+# plies to mate at a byte a position. Probing maps the file and reads one
+# of each, whatever the table's size.
+
+# In build order, KPK promotes into KQK and KRK
+TABLES = ('KQK', 'KRK', 'KPK', 'KBNK')
+# Nothing can be won with these
+DRAWN_MATERIAL = ('KK', 'KBK', 'KNK')
+# The strong side's pieces in table name order
+NAME_ORDER = (QUEEN, ROOK, BISHOP, KNIGHT, PAWN)
+
+# Results as stored, for the side to move
+DRAW, WIN, LOSS, INVALID = 0, 1, 2, 3
+HEADER = struct.Struct('<4s8sIH')
+MAGIC = b'TBL1'
+DEFAULT_DIRECTORY = 'tablebases'
+
+# Working state of a position while building, a byte each: plies to mate
+# plus one once it is decided as won (white to move) or lost (black to
+# move), else one of these
+UNKNOWN = 0
+DRAWN = 254
+ILLEGAL = 255
+
+# a1 b1 c1 d1 b2 c2 d2 c3 d3 d4
+TRIANGLE = (0, 1, 2, 3, 9, 10, 11, 18, 19, 27)
+DIAGONAL = (0, 9, 18, 27)
+
+
+def _transform(sq, flip_file, flip_rank, swap):
+    row, col = divmod(sq, 8)
+    if flip_file:
+        col = 7 - col
+    if flip_rank:
+        row = 7 - row
+    if swap:
+        row, col = col, row
+    return row * 8 + col
+
+
+# The eight symmetries of the board as square maps, the identity first and
+# the file mirror second
+TRANSFORMS = [[_transform(sq, flip_file, flip_rank, swap) for sq in range(64)]
+              for swap in (0, 1) for flip_rank in (0, 1) for flip_file in (0, 1)]
+# TRANSPOSED[t] is the symmetry doing TRANSFORMS[t] and then mirroring the
+# board in the a1-h8 diagonal
+TRANSPOSED = [TRANSFORMS.index([TRANSFORMS[4][target] for target in transform]) for transform in TRANSFORMS]
+
+
+class Material:
+    # Index layout and move rules of one table, such as KBNK: the white king,
+    # the other white pieces in the order of the name, then the black king
+    def __init__(self, name):
+        self.name = name
+        self.pieces = [PIECE_TYPES.index(letter) for letter in name[1:-1]]
+        self.pawns = PAWN in self.pieces
+        if self.pawns:
+            # Pawns only allow the mirror between the a-d and e-h files
+            self.king_squares = [sq for sq in range(64) if sq & 7 < 4]
+            usable = TRANSFORMS[:2]
+        else:
+            self.king_squares = list(TRIANGLE)
+            usable = TRANSFORMS
+        self.king_index = [-1] * 64
+        for index, sq in enumerate(self.king_squares):
+            self.king_index[sq] = index
+        # The symmetry that takes the white king on each square into the
+        # indexed part of the board
+        self.king_transform = [next(number for number, transform in enumerate(usable)
+                                    if self.king_index[transform[sq]] >= 0)
+                               for sq in range(64)]
+        self.per_side = len(self.king_squares) * 64 ** (len(self.pieces) + 1)
+        self.size = 2 * self.per_side
+
+    def index(self, side, wk, others, bk):
+        number = self.king_transform[wk]
+        transform = TRANSFORMS[number]
+        if not self.pawns and transform[wk] in DIAGONAL:
+            # A king on the diagonal leaves the mirror in it free, so take
+            # the one with the first piece off the diagonal below it
+            for sq in others + [bk]:
+                row, col = divmod(transform[sq], 8)
+                if row != col:
+                    if row > col:
+                        transform = TRANSFORMS[TRANSPOSED[number]]
+                    break
+        index = self.king_index[transform[wk]]
+        for sq in others:
+            index = index * 64 + transform[sq]
+        return side * self.per_side + index * 64 + transform[bk]
+
+    def decode(self, index):
+        # (side to move, white king, [other white pieces], black king)
+        side, index = divmod(index, self.per_side)
+        index, bk = divmod(index, 64)
+        others = []
+        for _ in self.pieces:
+            index, sq = divmod(index, 64)
+            others.append(sq)
+        others.reverse()
+        return side, self.king_squares[index], others, bk
+
+    def attacks(self, wk, others, occupied):
+        attacked = KING_ATTACKS[wk]
+        for piece, sq in zip(self.pieces, others):
+            if piece == PAWN:
+                attacked |= PAWN_ATTACKS[WHITE][sq]
+            elif piece == KNIGHT:
+                attacked |= KNIGHT_ATTACKS[sq]
+            else:
+                if piece != BISHOP:
+                    attacked |= rook_attacks(sq, occupied)
+                if piece != ROOK:
+                    attacked |= bishop_attacks(sq, occupied)
+        return attacked
+
+    def legal(self, side, wk, others, bk):
+        occupied = 1 << wk | 1 << bk
+        for piece, sq in zip(self.pieces, others):
+            if occupied >> sq & 1 or (piece == PAWN and not 8 <= sq < 56):
+                return False
+            occupied |= 1 << sq
+        if wk == bk or KING_ATTACKS[wk] >> bk & 1:
+            return False
+        # Black cannot be in check with white to move
+        return side == BLACK or not self.attacks(wk, others, occupied) >> bk & 1
+
+    def black_moves(self, wk, others, bk):
+        # (squares the black king can go to, which of them take a piece,
+        # whether it is in check)
+        whites = 0
+        for sq in others:
+            whites |= 1 << sq
+        # The king does not shield the squares behind it
+        attacked = self.attacks(wk, others, whites | 1 << wk)
+        targets = KING_ATTACKS[bk] & ~attacked
+        return targets, targets & whites, attacked >> bk & 1
+
+    def white_unmoves(self, wk, others, bk):
+        # (white king, others) before each white move that could have led here
+        occupied = 1 << wk | 1 << bk
+        for sq in others:
+            occupied |= 1 << sq
+        empty = ~occupied
+        for source in squares(KING_ATTACKS[wk] & empty & ~KING_ATTACKS[bk]):
+            yield source, others
+        for i, (piece, sq) in enumerate(zip(self.pieces, others)):
+            if piece == PAWN:
+                sources = []
+                if sq >= 16 and empty >> (sq - 8) & 1:
+                    sources.append(sq - 8)
+                    if 24 <= sq < 32 and empty >> (sq - 16) & 1:
+                        sources.append(sq - 16)
+            elif piece == KNIGHT:
+                sources = squares(KNIGHT_ATTACKS[sq] & empty)
+            else:
+                targets = 0
+                if piece != BISHOP:
+                    targets |= rook_attacks(sq, occupied)
+                if piece != ROOK:
+                    targets |= bishop_attacks(sq, occupied)
+                sources = squares(targets & empty)
+            for source in sources:
+                yield wk, others[:i] + [source] + others[i + 1:]
+
+
+class Table:
+    # One table file, mapped
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, name, size, self.max_dtm = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a tablebase file")
+        self.material = Material(name.rstrip(b'\0').decode())
+        if size != self.material.size:
+            raise ValueError(f"{path} has {size} positions, {self.material.name} needs {self.material.size}")
+        self.dtm_offset = HEADER.size + (size + 3) // 4
+
+    def probe(self, index):
+        # (result code, plies to mate) of the position at index
+        code = self.map[HEADER.size + (index >> 2)] >> ((index & 3) * 2) & 3
+        return code, self.map[self.dtm_offset + index]
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+class Tablebases:
+    # The tables found in a directory, opened as they are first needed
+    def __init__(self, directory=DEFAULT_DIRECTORY):
+        self.directory = directory
+        self.tables = {}
+
+    def table(self, name):
+        if name not in self.tables:
+            path = os.path.join(self.directory, name + '.tb')
+            self.tables[name] = Table(path) if os.path.exists(path) else None
+        return self.tables[name]
+
+    def probe_squares(self, name, side, wk, others, bk):
+        # (wdl, plies to mate) with white as the side with the pieces, as
+        # probe returns it, or None
+        table = self.table(name)
+        if table is None:
+            return None
+        code, dtm = table.probe(table.material.index(side, wk, others, bk))
+        if code == INVALID:
+            return None
+        return (1 if code == WIN else -1 if code == LOSS else 0), dtm
+
+    def probe(self, position):
+        # (wdl, plies to mate) for the side to move, wdl being 1 for a win,
+        # 0 for a draw and -1 for a loss. None when no table has the position.
+        if position.castling or popcount(position.occupied[WHITE] | position.occupied[BLACK]) > 4:
+            return None
+        pieces = position.pieces
+        strong = None
+        letters = ''
+        others = []
+        for colour in (WHITE, BLACK):
+            for piece_type in NAME_ORDER:
+                bb = pieces[colour * 6 + piece_type]
+                if bb:
+                    if strong not in (None, colour):
+                        return None
+                    strong = colour
+                    for sq in squares(bb):
+                        letters += PIECE_TYPES[piece_type]
+                        others.append(sq)
+        name = 'K' + letters + 'K'
+        if name in DRAWN_MATERIAL:
+            return 0, 0
+        # Mirror the ranks when black has the pieces
+        flip = 56 if strong == BLACK else 0
+        wk = pieces[strong * 6 + KING].bit_length() - 1
+        bk = pieces[(strong ^ 1) * 6 + KING].bit_length() - 1
+        return self.probe_squares(name, position.side ^ strong, wk ^ flip, [sq ^ flip for sq in others], bk ^ flip)
+
+    def best_move(self, position):
+        # (move, wdl, plies to mate) of the quickest win, else a draw, else
+        # the longest loss. None when no table has the position.
+        if self.probe(position) is None:
+            return None
+        best = None
+        for move in legal_moves(position):
+            position.make(move)
+            result = self.probe(position)
+            position.unmake()
+            if result is None:
+                continue
+            wdl, plies = -result[0], result[1] + 1
+            rank = (wdl, -plies if wdl > 0 else plies)
+            if best is None or rank > best[0]:
+                best = (rank, move, wdl, plies)
+        return best and best[1:]
+
+    def close(self):
+        for table in self.tables.values():
+            if table is not None:
+                table.close()
+        self.tables.clear()
+
+
+# Per process state of a build worker, set up by _attach
+_memory = None
+_state = None
+_material = None
+_tablebases = None
+
+
+def promotion_tables(name):
+    # The tables a table's pawns promote into, which it is built from
+    pieces = name[1:-1]
+    if 'P' not in pieces:
+        return []
+    rest = pieces.replace('P', '', 1)
+    return ['K' + promoted + rest + 'K' for promoted in 'QR']
+
+
+def _attach(name, table, directory):
+    global _memory, _state, _material, _tablebases
+    _memory = shared_memory.SharedMemory(name=name)
+    _state = _memory.buf
+    _material = Material(table)
+    _tablebases = Tablebases(directory)
+
+
+def _classify(start, stop):
+    # First pass over a range of indices: mark illegal positions, mates,
+    # stalemates and positions where black can take a piece, and find the
+    # pawn moves that promote into a won position. Returns the mates and the
+    # (index, plies to mate) of those promotions.
+    material = _material
+    state = _state
+    mates = array('I')
+    promotions = []
+    for index in range(start, stop):
+        side, wk, others, bk = material.decode(index)
+        if not material.legal(side, wk, others, bk) or material.index(side, wk, others, bk) != index:
+            # Illegal, or the diagonal mirror of a position indexed elsewhere
+            state[index] = ILLEGAL
+        elif side == BLACK:
+            targets, captures, check = material.black_moves(wk, others, bk)
+            if not targets:
+                if check:
+                    state[index] = 1
+                    mates.append(index)
+                else:
+                    state[index] = DRAWN
+            elif captures:
+                # Taking leaves too little to mate with
+                state[index] = DRAWN
+        elif material.pawns:
+            best = None
+            for i, (piece, sq) in enumerate(zip(material.pieces, others)):
+                if piece != PAWN or sq < 48 or sq + 8 in (wk, bk):
+                    continue
+                for promoted in (QUEEN, ROOK):
+                    rest = [other for j, other in enumerate(others) if j != i]
+                    name = 'K' + PIECE_TYPES[promoted] + ''.join(PIECE_TYPES[p] for j, p in enumerate(material.pieces) if j != i) + 'K'
+                    if _tablebases.table(name) is None:
+                        # A missing table would make every promotion a draw
+                        raise FileNotFoundError(f"{material.name} needs {name}, build it first")
+                    result = _tablebases.probe_squares(name, BLACK, wk, [sq + 8] + rest, bk)
+                    if result is not None and result[0] < 0 and (best is None or result[1] + 1 < best):
+                        best = result[1] + 1
+            if best is not None:
+                promotions.append((index, best))
+    return mates, promotions
+
+
+def _white_predecessors(indices):
+    # Undecided white to move positions with a move into one of these lost
+    # black to move positions
+    material = _material
+    state = _state
+    found = set()
+    for index in indices:
+        _, wk, others, bk = material.decode(index)
+        for king, pieces in material.white_unmoves(wk, others, bk):
+            occupied = 1 << king | 1 << bk
+            for sq in pieces:
+                occupied |= 1 << sq
+            if material.attacks(king, pieces, occupied) >> bk & 1:
+                continue
+            before = material.index(WHITE, king, pieces, bk)
+            if state[before] == UNKNOWN:
+                found.add(before)
+    return array('I', found)
+
+
+def _lost(wk, others, bk):
+    # True when every black move leads to a position already won for white
+    material = _material
+    state = _state
+    targets, _, _ = material.black_moves(wk, others, bk)
+    for target in squares(targets):
+        value = state[material.index(WHITE, wk, others, target)]
+        if value == UNKNOWN or value >= DRAWN:
+            return False
+    return True
+
+
+def _black_predecessors(indices):
+    # Undecided black to move positions that these won white to move
+    # positions have made lost
+    material = _material
+    state = _state
+    found = set()
+    for index in indices:
+        _, wk, others, bk = material.decode(index)
+        occupied = 1 << wk | 1 << bk
+        for sq in others:
+            occupied |= 1 << sq
+        for source in squares(KING_ATTACKS[bk] & ~occupied & ~KING_ATTACKS[wk]):
+            before = material.index(BLACK, wk, others, source)
+            if before not in found and state[before] == UNKNOWN and _lost(wk, others, source):
+                found.add(before)
+    return array('I', found)
+
+
+def _chunks(items, parts, smallest=2000):
+    size = max(smallest, -(-len(items) // parts))
+    return [items[start:start + size] for start in range(0, len(items), size)]
+
+
+def generate(name, directory=DEFAULT_DIRECTORY, workers=None, report=None):
+    # Build one table and write it to directory/NAME.tb. Positions are
+    # decided a ply at a time, from the mates outwards, each ply split
+    # between the worker processes. Tables the pawns promote into are built
+    # first when the directory lacks them. Returns (positions, bytes,
+    # seconds) for this table alone.
+    workers = workers or os.cpu_count() or 1
+    for needed in promotion_tables(name):
+        if not os.path.exists(os.path.join(directory, needed + '.tb')):
+            generate(needed, directory, workers, report)
+    start = time.perf_counter()
+    material = Material(name)
+    size = material.size
+    memory = shared_memory.SharedMemory(create=True, size=size)
+    try:
+        state = memory.buf
+        state[:] = bytes(size)
+        with multiprocessing.Pool(workers, initializer=_attach, initargs=(memory.name, name, directory)) as pool:
+            ranges = [(first, min(first + 65536, size)) for first in range(0, size, 65536)]
+            levels = {0: array('I')}
+            for mates, promotions in pool.starmap(_classify, ranges):
+                levels[0].extend(mates)
+                for index, plies in promotions:
+                    levels.setdefault(plies, array('I')).append(index)
+            ply = 0
+            while levels:
+                frontier = levels.pop(ply, array('I'))
+                if ply % 2:
+                    # White to move positions won in ply plies. Promotions
+                    # wait for their ply, and may have been beaten to it.
+                    decided = array('I')
+                    for index in frontier:
+                        if state[index] == UNKNOWN:
+                            state[index] = ply + 1
+                        if state[index] == ply + 1:
+                            decided.append(index)
+                    frontier = array('I', sorted(set(decided)))
+                    work = _black_predecessors
+                else:
+                    work = _white_predecessors
+                if frontier:
+                    following = array('I')
+                    for found in pool.map(work, _chunks(frontier, workers * 4)):
+                        for index in found:
+                            if state[index] == UNKNOWN:
+                                # Decided one ply later than this level
+                                state[index] = ply + 2
+                                following.append(index)
+                    if following:
+                        levels.setdefault(ply + 1, array('I')).extend(following)
+                if report:
+                    report(f"{name} ply {ply}: {len(frontier)} positions")
+                ply += 1
+
+        # Everything still undecided is a draw
+        wdl = bytearray((size + 3) // 4)
+        dtm = bytearray(size)
+        max_dtm = 0
+        for index in range(size):
+            value = state[index]
+            if value == ILLEGAL:
+                code = INVALID
+            elif UNKNOWN < value < DRAWN:
+                code = WIN if index < material.per_side else LOSS
+                dtm[index] = value - 1
+                max_dtm = max(max_dtm, value - 1)
+            else:
+                continue
+            wdl[index >> 2] |= code << ((index & 3) * 2)
+        del state
+    finally:
+        memory.close()
+        memory.unlink()
+
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name + '.tb')
+    with open(path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, name.encode(), size, max_dtm))
+        file.write(wdl)
+        file.write(dtm)
+    return size, os.path.getsize(path), time.perf_counter() - start
+
+
+def main(argv=None):
+    # python -m engine.tablebase generate [--workers N] [--dir DIR] [TABLE ...]
+    # python -m engine.tablebase probe [--dir DIR] fen
+    parser = argparse.ArgumentParser(description="Build and probe endgame tablebases")
+    commands = parser.add_subparsers(dest='command', required=True)
+    command = commands.add_parser('generate', help="build tables, all of them by default")
+    command.add_argument('tables', nargs='*', default=list(TABLES), choices=TABLES, metavar='TABLE')
+    command.add_argument('--workers', type=int, default=os.cpu_count(), help="worker processes, all cores by default")
+    command.add_argument('--dir', default=DEFAULT_DIRECTORY, help="directory the tables are written to")
+    command.add_argument('--verbose', action='store_true', help="print every ply as it is decided")
+    command = commands.add_parser('probe', help="look a position up and print the best move")
+    command.add_argument('fen', nargs='+')
+    command.add_argument('--dir', default=DEFAULT_DIRECTORY, help="directory holding the tables")
+    args = parser.parse_args(argv)
+
+    if args.command == 'generate':
+        # KPK needs KQK and KRK, so they are built in table order and
+        # generate makes any that are missing
+        for name in sorted(args.tables, key=TABLES.index):
+            positions, size, elapsed = generate(name, args.dir, args.workers, print if args.verbose else None)
+            print(f"{name}: {positions} positions, {size / 1024:.0f} KB, {elapsed:.1f} s "
+                  f"on {args.workers} workers")
+        return 0
+
+    position = position_from_fen(' '.join(args.fen))
+    tablebases = Tablebases(args.dir)
+    start = time.perf_counter()
+    result = tablebases.probe(position)
+    elapsed = time.perf_counter() - start
+    if result is None:
+        print("not in the tables")
+        return 1
+    wdl, plies = result
+    print(f"{('loss', 'draw', 'win')[wdl + 1]}" + (f" mate in {plies} plies" if wdl else "")
+          + f", probed in {elapsed * 1e6:.0f} us")
+    best = tablebases.best_move(position)
+    if best:
+        print(f"bestmove {move_to_uci(best[0])}")
+    tablebases.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+from array import array
+
+# Bound types
+EXACT = 1
+LOWER = 2
+UPPER = 3
+
+ENTRY_BYTES = 16
+BUCKET_ENTRIES = 2
+BUCKET_BYTES = BUCKET_ENTRIES * ENTRY_BYTES
+SCORE_OFFSET = 1 << 19
+# Buckets sampled for the occupancy figure
+OCCUPANCY_SAMPLE = 1000
+
+
+def bucket_count(size_mb):
+    # The most buckets, a power of two, that fit in size_mb megabytes. The
+    # parallel search sizes its shared table with this too.
+    buckets = 1
+    while buckets * 2 * BUCKET_BYTES <= size_mb * 1024 * 1024:
+        buckets *= 2
+    return buckets
+
+
+class TranspositionTable:
+    # Fixed size hash table of search results in one flat array of 64-bit
+    # words, two words per entry: the key xor'ed with the data, then the data
+    # packed as move (16 bits), score (20), depth (8), bound (2) and
+    # generation (8). Storing the key xor'ed lets a reader spot an entry
+    # that was torn by a concurrent writer, so the same layout can sit in
+    # shared memory.
+    #
+    # Each bucket has two entries. The first keeps the deepest result of the
+    # current search and the second always takes whatever the first turned
+    # away or pushed out.
+    def __init__(self, size_mb=64, buffer=None):
+        if buffer is None:
+            buckets = bucket_count(size_mb)
+            self.table = array('Q', bytes(buckets * BUCKET_BYTES))
+        else:
+            # An existing writable buffer, whose length must be a power of two
+            # number of buckets
+            self.table = memoryview(buffer).cast('Q')
+            buckets = len(self.table) * 8 // BUCKET_BYTES
+        self.mask = buckets - 1
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    def __len__(self):
+        # Number of entries the table can hold
+        return (self.mask + 1) * BUCKET_ENTRIES
+
+    def new_search(self):
+        # Entries from older searches may then be replaced regardless of depth
+        self.generation = (self.generation + 1) & 0xFF
+
+    def clear(self):
+        table = self.table
+        for index in range(len(table)):
+            table[index] = 0
+        self.probes = self.hits = self.stores = 0
+
+    def probe(self, key):
+        # (move, score, depth, bound) stored for the key, or None
+        self.probes += 1
+        table = self.table
+        index = (key & self.mask) << 2
+        for slot in (index, index + 2):
+            data = table[slot + 1]
+            if data and table[slot] ^ data == key:
+                self.hits += 1
+                return (data & 0xFFFF, (data >> 16 & 0xFFFFF) - SCORE_OFFSET,
+                        data >> 36 & 0xFF, data >> 44 & 3)
+        return None
+
+    def store(self, key, depth, score, bound, move):
+        self.stores += 1
+        table = self.table
+        index = (key & self.mask) << 2
+        data = table[index + 1]
+        old_key = table[index] ^ data
+        if (not data or old_key == key or depth >= (data >> 36 & 0xFF)
+                or (data >> 46 & 0xFF) != self.generation):
+            slot = index
+            if data and old_key != key:
+                # The entry pushed out still beats what the second slot holds
+                table[index + 2] = table[index]
+                table[index + 3] = data
+        else:
+            slot = index + 2
+            data = table[slot + 1]
+            old_key = table[slot] ^ data
+        if not move and data and old_key == key:
+            # Keep the best move of a shallower search of the same position
+            move = data & 0xFFFF
+        data = (move | (score + SCORE_OFFSET) << 16 | min(depth, 0xFF) << 36
+                | bound << 44 | self.generation << 46)
+        table[slot] = key ^ data
+        table[slot + 1] = data
+
+    def stats(self):
+        # Hit rate over all probes and the share of sampled entries filled
+        # in by the current search
+        table = self.table
+        buckets = self.mask + 1
+        # Spread the sampled buckets evenly over the whole table, since the
+        # keys of a short search may leave the first buckets empty
+        step = max(buckets // OCCUPANCY_SAMPLE, 1)
+        sample = 0
+        used = 0
+        for bucket in range(0, buckets, step):
+            for slot in range(bucket << 2, (bucket << 2) + 4, 2):
+                data = table[slot + 1]
+                if data and (data >> 46 & 0xFF) == self.generation:
+                    used += 1
+                sample += 1
+        return {
+            'entries': len(self),
+            'size_mb': len(table) * 8 / (1024 * 1024),
+            'probes': self.probes,
+            'hits': self.hits,
+            'hit_rate': self.hits / self.probes if self.probes else 0.0,
+            'stores': self.stores,
+            'occupancy': used / sample,
+        }
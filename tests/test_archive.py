@@ -0,0 +1,84 @@
+import os
+import struct
+from array import array
+
+from engine import archive
+from engine.archive import ArchiveReader, ArchiveWriter
+from engine.fen import START_FEN, position_from_fen
+from engine.movegen import move_from_uci
+
+
+def uci_moves(fen, text):
+    position = position_from_fen(fen)
+    moves = []
+    for uci in text.split():
+        move = move_from_uci(position, uci)
+        position.make(move)
+        moves.append(move)
+    return moves
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / 'games')
+    first = uci_moves(START_FEN, 'e2e4 e7e5 g1f3 b8c6')
+    second = uci_moves('4k3/8/8/8/8/8/8/4K2R w K - 0 1', 'e1g1')
+    with ArchiveWriter(path) as writer:
+        writer.append(first, '1-0')
+        writer.append(second, '*', '4k3/8/8/8/8/8/8/4K2R w K - 0 1')
+    with ArchiveReader(path) as reader:
+        assert len(reader) == 2
+        assert reader.header(0) == (4, '1-0', START_FEN)
+        assert reader.header(1) == (1, '*', '4k3/8/8/8/8/8/8/4K2R w K - 0 1')
+        for number, expected in enumerate((first, second)):
+            moves = reader.moves(number)
+            assert list(moves) == expected
+            moves.release()
+
+    # Little-endian on disk whatever the machine
+    with open(path, 'rb') as file:
+        data = file.read()
+    assert data[archive.HEADER.size:archive.HEADER.size + 8] == struct.pack('<4H', *first)
+
+
+def test_native_swaps_on_big_endian(monkeypatch):
+    data = struct.pack('<3H', 1, 0x1234, 0xFFFE)
+    assert list(archive._native(data, 'H')) == [1, 0x1234, 0xFFFE]
+    # A big-endian reader swaps the numbers it maps
+    monkeypatch.setattr(archive.sys, 'byteorder', 'big')
+    swapped = array('H', data)
+    swapped.byteswap()
+    assert list(archive._native(data, 'H')) == list(swapped)
+
+
+def test_offsets_wait_for_their_games(tmp_path):
+    path = str(tmp_path / 'games')
+    moves = uci_moves(START_FEN, 'd2d4 d7d5')
+    with ArchiveWriter(path) as writer:
+        writer.append(moves, '*')
+        # Nothing in the index points at a game that is not on disk yet
+        assert os.path.getsize(path + '.idx') == 0
+        writer.flush()
+        assert os.path.getsize(path + '.idx') == 8
+        assert os.path.getsize(path) == archive.HEADER.size + 4
+        writer.append(moves, '1-0')
+    assert os.path.getsize(path + '.idx') == 16
+
+
+def test_offset_cut_short(tmp_path):
+    # A writer that died in the middle of an offset leaves 3 stray bytes
+    path = str(tmp_path / 'games')
+    moves = uci_moves(START_FEN, 'c2c4')
+    with ArchiveWriter(path) as writer:
+        writer.append(moves, '*')
+    with open(path + '.idx', 'ab') as index:
+        index.write(b'\x10\x00\x00')
+    with ArchiveReader(path) as reader:
+        assert len(reader) == 1
+    # The next writer drops them before adding its own games
+    with ArchiveWriter(path) as writer:
+        writer.append(moves, '0-1')
+    with ArchiveReader(path) as reader:
+        assert len(reader) == 2 and reader.header(1) == (1, '0-1', START_FEN)
+        played = reader.moves(1)
+        assert list(played) == moves
+        played.release()
@@ -0,0 +1,53 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from engine.batch import evaluate_batch, mobility, mobility_batch, random_positions
+from engine.evaluate import evaluate
+from engine.fen import START_FEN, position_from_fen
+from engine.rules import Game, create_board
+
+FENS = [
+    START_FEN,
+    'r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR w KQkq - 4 4',
+    'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+    '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+    '4k3/8/8/8/8/8/8/4K2R b K - 0 1',
+    '8/8/8/4k3/8/8/3QK3/8 b - - 0 1',
+]
+
+
+def test_matches_scalar():
+    positions = [position_from_fen(fen) for fen in FENS] + random_positions(50, 7)
+    scores = evaluate_batch(positions)
+    counts = mobility_batch(positions)
+    assert scores.tolist() == [evaluate(position) for position in positions]
+    assert counts.tolist() == [mobility(position) for position in positions]
+
+
+def test_chunk_boundary():
+    # Chunks that split the input give the same results as one chunk
+    positions = random_positions(23, 3)
+    whole = evaluate_batch(positions)
+    assert evaluate_batch(positions, chunk=5).tolist() == whole.tolist()
+    assert evaluate_batch(iter(positions), chunk=1).tolist() == whole.tolist()
+    assert (mobility_batch(positions, chunk=5).tolist()
+            == mobility_batch(positions).tolist()
+            == [mobility(position) for position in positions])
+
+
+def test_empty():
+    assert evaluate_batch([]).shape == (0,)
+    assert mobility_batch([]).shape == (0, 2)
+    assert evaluate_batch(iter(()), chunk=4).dtype == np.int32
+
+
+def test_mixed_inputs():
+    # FENs, Games and list boards all score like their Positions
+    game = Game()
+    game.make_move((1, 4), (3, 4))
+    items = [FENS[1], game, create_board(), (create_board(), 1), position_from_fen(FENS[3])]
+    expected = [position_from_fen(FENS[1]), game.bitboards, position_from_fen(START_FEN),
+                position_from_fen(START_FEN.replace(' w ', ' b ')), position_from_fen(FENS[3])]
+    assert evaluate_batch(items, chunk=2).tolist() == [evaluate(position) for position in expected]
+    assert mobility_batch(items, chunk=2).tolist() == [mobility(position) for position in expected]
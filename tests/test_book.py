@@ -0,0 +1,60 @@
+import struct
+from collections import defaultdict
+
+import pytest
+
+from engine.book import ENTRY, OpeningBook, book_key, load_randoms, to_polyglot, write_book
+from engine.fen import START_FEN, position_from_fen
+from engine.movegen import move_from_uci
+from engine.zobrist import RANDOM64
+
+# Keys from the Polyglot book format's description
+POLYGLOT_KEYS = [
+    (START_FEN, 0x463B96181691FC9C),
+    ('rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1', 0x823C9B50FD114196),
+    ('rnbqkbnr/ppp1pppp/8/3p4/4P3/8/PPPP1PPP/RNBQKBNR w KQkq d6 0 2', 0x0756B94461C50FB0),
+    ('rnbqkbnr/ppp1pppp/8/3pP3/8/8/PPPP1PPP/RNBQKBNR b KQkq - 0 2', 0x662FAFB965DB29D4),
+    ('rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3', 0x22A48B5A8E47FF78),
+    ('rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPPKPPP/RNBQ1BNR b kq - 0 3', 0x652A607CA3F242C1),
+    ('rnbq1bnr/ppp1pkpp/8/3pPp2/8/8/PPPPKPPP/RNBQ1BNR w - - 0 4', 0x00FDD303C946BDD9),
+    ('rnbqkbnr/p1pppppp/8/8/PpP4P/8/1P1PPPP1/RNBQKBNR b KQkq c3 0 3', 0x3C8123EA7B067637),
+    ('rnbqkbnr/p1pppppp/8/8/P6P/R1p5/1P1PPPP1/1NBQKBNR b Kkq - 0 4', 0x5C3F9B829B279560),
+]
+
+
+def test_start_position_key():
+    assert position_from_fen(START_FEN).key == 0x463B96181691FC9C
+
+
+@pytest.mark.parametrize('fen, key', POLYGLOT_KEYS)
+def test_polyglot_keys(fen, key):
+    position = position_from_fen(fen)
+    assert book_key(position) == key
+    assert book_key(position, RANDOM64) == key
+
+
+def test_load_randoms(tmp_path):
+    path = tmp_path / 'keys.c'
+    path.write_text(',\n'.join(f'U64(0x{number:016X})' for number in RANDOM64))
+    assert load_randoms(str(path)) == RANDOM64
+
+
+def test_reads_a_standard_book(tmp_path):
+    # An entry as other programs write it: e2e4 from the start position
+    path = tmp_path / 'book.bin'
+    e2e4 = 28 | 12 << 6
+    path.write_bytes(ENTRY.pack(0x463B96181691FC9C, e2e4, 10, 0))
+    position = position_from_fen(START_FEN)
+    with OpeningBook(str(path)) as book:
+        assert book.moves(position) == [(move_from_uci(position, 'e2e4'), 10)]
+
+
+def test_written_book_is_polyglot(tmp_path):
+    position = position_from_fen(START_FEN)
+    move = move_from_uci(position, 'g1f3')
+    weights = defaultdict(lambda: defaultdict(int))
+    weights[position.key][to_polyglot(move)] = 3
+    path = tmp_path / 'book.bin'
+    write_book(str(path), weights)
+    key, polyglot_move = struct.unpack_from('>QH', path.read_bytes())
+    assert key == 0x463B96181691FC9C and polyglot_move == 21 | 6 << 6
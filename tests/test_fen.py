@@ -0,0 +1,59 @@
+import io
+
+import pytest
+
+from engine.fen import START_FEN, fen_counters, position_from_fen, position_to_fen, read_fens
+from engine.movegen import legal_moves
+from engine.move import move_to_uci
+
+FENS = [
+    START_FEN,
+    'rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR w KQkq e6 0 2',
+    'rnbqkbnr/pppppppp/8/8/3P4/8/PPP1PPPP/RNBQKBNR b KQkq d3 0 1',
+    'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+    '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 13 40',
+    '4k3/8/8/8/8/8/8/4K2R b K - 0 1',
+]
+
+
+@pytest.mark.parametrize('fen', FENS)
+def test_round_trip(fen):
+    position = position_from_fen(fen)
+    assert position_to_fen(position, *fen_counters(fen)) == fen
+
+
+@pytest.mark.parametrize('fen, message', [
+    ('rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP w KQkq - 0 1', '8 ranks'),
+    ('rnbqkbnr/pppppppp/9/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1', 'unknown piece'),
+    ('rnbqkbnr/pppppppp/7/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1', 'not 8 squares'),
+    ('rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPPP/RNBQKBNR w KQkq - 0 1', 'not 8 squares'),
+    ('rnbqkbnr/pppppppp/8/8/4X3/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1', 'unknown piece'),
+    ('rnbq1bnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQ - 0 1', 'black king'),
+    ('rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKKNR w kq - 0 1', 'white king'),
+    ('rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR x KQkq - 0 1', 'w or b'),
+    ('rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq', '4 fields'),
+    ('rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq e9 0 1', 'en passant'),
+    # No pawn in front of the square, the wrong rank for the side to move,
+    # and a pawn that could not have come from its start square
+    ('rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq e6 0 1', 'en passant'),
+    ('rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e6 0 2', 'en passant'),
+    ('rnbqkbnr/pppppppp/8/4p3/8/8/PPPPPPPP/RNBQKBNR w KQkq e6 0 2', 'en passant'),
+])
+def test_rejected(fen, message):
+    with pytest.raises(ValueError, match=message):
+        position_from_fen(fen)
+
+
+def test_en_passant_capture():
+    # A valid en passant square gives the capture, and the position it is
+    # made in plays on normally
+    position = position_from_fen('4k3/8/8/3pP3/8/8/8/4K3 w - d6 0 2')
+    moves = {move_to_uci(move): move for move in legal_moves(position)}
+    position.make(moves['e5d6'])
+    assert position_to_fen(position) == '4k3/8/3P4/8/8/8/8/4K3 b - - 0 1'
+
+
+def test_read_fens_line_numbers():
+    stream = io.StringIO(f"# suite\n{START_FEN}\n\n8/8/8/8/8/8/8/8 w - - 0 1 ;no kings\n")
+    with pytest.raises(ValueError, match='line 4'):
+        list(read_fens(stream))
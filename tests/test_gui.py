@@ -0,0 +1,71 @@
+import os
+import runpy
+import shutil
+import sys
+
+import pytest
+
+pygame = pytest.importorskip("pygame")
+
+CHESS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "chess.py")
+
+
+def square_pos(name):
+    # Screen point in the middle of a square named like "e2"
+    col = "abcdefgh".index(name[0])
+    row = int(name[1]) - 1
+    return (col * 80 + 40, (7 - row) * 80 + 40)
+
+
+def test_computer_reply_drawn_before_blocking(monkeypatch, tmp_path):
+    monkeypatch.setenv("SDL_VIDEODRIVER", "dummy")
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    monkeypatch.chdir(os.path.dirname(CHESS))
+    monkeypatch.setattr(sys, "argv", ["chess.py", "--computer", "black", "--think", "0.05"])
+    clicks = [square_pos("g1"), square_pos("f3")]
+    waits = []
+
+    def wait():
+        # Every time the loop goes to sleep the screen must already show
+        # the game, so drawing now has nothing to repaint
+        gui = sys.modules["__main__"].__dict__
+        waits.append((gui["game"].fen(), gui["draw_board"]()))
+        if clicks:
+            return pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=clicks.pop(0), button=1)
+        return pygame.event.Event(pygame.QUIT)
+
+    monkeypatch.setattr(pygame.event, "wait", wait)
+    runpy.run_path(CHESS, run_name="__main__")
+
+    assert [dirty for _, dirty in waits] == [[], [], []]
+    # The last sleep came after the computer's reply
+    assert waits[-1][0].split()[1] == "w"
+    assert waits[-1][0] != waits[-2][0]
+
+
+def test_sprite_atlas_cache(monkeypatch, tmp_path):
+    monkeypatch.setenv("SDL_VIDEODRIVER", "dummy")
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    import chess
+    assets = tmp_path / "assets"
+    shutil.copytree(os.path.join(os.path.dirname(CHESS), chess.ASSETS), assets)
+    monkeypatch.setattr(chess, "ASSETS", str(assets))
+    pygame.init()
+    try:
+        pygame.display.set_mode((100, 100))
+        images, images_small = chess.load_images()
+        assert len(images) == len(images_small) == 12
+        assert images[0].get_size() == (chess.BIG_SPRITE, chess.BIG_SPRITE)
+        cached = os.listdir(chess.cache_directory())
+        assert len(cached) == 1
+
+        # A changed sprite makes a new atlas in place of the old one
+        changed = assets / "WK.png"
+        os.utime(changed, ns=(os.stat(changed).st_mtime_ns + 10 ** 9,) * 2)
+        chess.load_images()
+        rebuilt = os.listdir(chess.cache_directory())
+        assert len(rebuilt) == 1 and rebuilt != cached
+        # Nothing is written next to the sprites
+        assert not [name for name in os.listdir(assets) if "atlas" in name]
+    finally:
+        pygame.quit()
@@ -0,0 +1,39 @@
+import io
+
+from engine import instrument
+from engine.rules import Game
+
+
+def test_counts_check_detection():
+    instrument.enable()
+    try:
+        instrument.reset()
+        game = Game()
+        assert game.make_move((1, 4), (3, 4))
+        counts = instrument.stats()
+    finally:
+        instrument.disable()
+    for name in ('Game.make_move', 'is_valid_move', 'Game.find_checked_king', 'Position.in_check',
+                 'Game.game_over', 'has_legal_move'):
+        assert counts[name]['calls'] > 0, name
+
+
+def test_disable_restores_the_rules():
+    make_move = Game.make_move
+    instrument.enable()
+    assert instrument.enabled() and Game.make_move is not make_move
+    instrument.disable()
+    assert not instrument.enabled() and Game.make_move is make_move
+
+
+def test_replay_trace():
+    trace = io.StringIO()
+    instrument.enable(trace)
+    try:
+        instrument.reset()
+        assert instrument.replay('1. f3 e5 2. g4 Qh4# 0-1') == 4
+        counts = instrument.stats()
+    finally:
+        instrument.disable()
+    assert counts['Game.make_move']['calls'] == 4
+    assert 'Game.find_checked_king' in trace.getvalue()
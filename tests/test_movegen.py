@@ -0,0 +1,32 @@
+import pytest
+
+from engine.fen import position_from_fen
+from engine.move import EP_CAPTURE
+from engine.movegen import has_legal_move, legal_moves
+from engine.perft import POSITIONS, perft
+
+
+@pytest.mark.parametrize('name, fen, counts', POSITIONS, ids=[name for name, _, _ in POSITIONS])
+def test_perft(name, fen, counts):
+    position = position_from_fen(fen)
+    for depth, expected in enumerate(counts[:3], 1):
+        assert perft(position, depth) == expected
+
+
+@pytest.mark.parametrize('fen, expected', [
+    ('rnb1kbnr/pppp1ppp/8/4p3/6Pq/5P2/PPPPP2P/RNBQKBNR w KQkq - 1 3', False),
+    ('7k/5Q2/6K1/8/8/8/8/8 b - - 0 1', False),
+    # In check, but the queen can be taken
+    ('7k/6Q1/8/8/8/8/8/K7 b - - 0 1', True),
+    # Only an en passant capture gets out of the pawn's check
+    ('8/8/8/2k5/3Pp3/8/8/4K2Q b - d3 0 1', True),
+])
+def test_has_legal_move(fen, expected):
+    position = position_from_fen(fen)
+    assert has_legal_move(position) == expected == bool(legal_moves(position))
+
+
+def test_en_passant_rank_pin():
+    # Taking would leave both pawns' rank open to the queen
+    moves = legal_moves(position_from_fen('8/8/8/8/k2Pp2Q/8/8/4K3 b - d3 0 1'))
+    assert moves and not [move for move in moves if move >> 12 == EP_CAPTURE]
@@ -0,0 +1,65 @@
+import builtins
+import importlib
+import io
+import sys
+
+from engine.fen import START_FEN, board_from_fen, position_from_fen
+from engine.pgn import validate, validate_game
+from engine.position import WHITE_KINGSIDE
+
+
+def test_castling_rights_need_king_and_rook_at_home():
+    assert position_from_fen('4k3/8/8/8/8/8/8/4K3 w K - 0 1').castling == 0
+    assert position_from_fen('4k3/8/8/8/8/8/8/4K2R w K - 0 1').castling == WHITE_KINGSIDE
+    assert position_from_fen(START_FEN).castling == 15
+    assert board_from_fen('r3k3/8/8/8/8/8/8/4K3 b Qq - 0 1', lambda colour, piece_type: (colour, piece_type))[2] == 8
+
+
+def test_castling_without_the_rook_is_illegal():
+    assert validate_game({'FEN': '4k3/8/8/8/8/8/8/4K3 w K - 0 1'}, '1. O-O') == \
+        (False, 1, '4k3/8/8/8/8/8/8/4K3 w - - 0 1', 0)
+
+
+def test_final_fen_move_counters():
+    legal, ply, fen, plies = validate_game({}, '1. e4 e5 2. Nf3 Nc6 3. Bb5 Nf6 4. Nc3 *')
+    assert (legal, ply, plies) == (True, None, 7)
+    assert fen.endswith(' b KQkq - 5 4')
+    # Counted on from the start FEN's, with black moving first
+    _, _, fen, _ = validate_game({'FEN': '4k3/8/8/8/8/8/8/R3K3 b Q - 10 30'}, '30... Kd7 31. Ra7+ Kc6')
+    assert fen.endswith(' w - - 13 32')
+
+
+def test_bad_game_does_not_stop_the_run():
+    pgn = '''[FEN "4k3/8/8/8/8/8/8/4K3 w K - 0 1"]
+
+1. O-O *
+
+[FEN "not a fen"]
+
+1. e4 *
+
+[Event "fine"]
+
+1. e4 e5 *
+'''
+    results = list(validate(io.StringIO(pgn), workers=2, batch_size=1))
+    assert [(number, legal) for number, legal, _, _, _ in results] == [(1, False), (2, False), (3, True)]
+    assert results[2][3] == 'rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR w KQkq e6 0 2'
+
+
+def test_no_resource_module(monkeypatch):
+    # Windows has no resource module, and chess.py imports engine.pgn
+    # through engine.book and engine.instrument
+    real_import = builtins.__import__
+
+    def without_resource(name, *args, **kwargs):
+        if name == 'resource':
+            raise ImportError(name)
+        return real_import(name, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, '__import__', without_resource)
+    for name in ('engine.pgn', 'engine.book', 'engine.instrument'):
+        monkeypatch.delitem(sys.modules, name, raising=False)
+    for name in ('engine.pgn', 'engine.book', 'engine.instrument'):
+        importlib.import_module(name)
+    assert sys.modules['engine.pgn'].peak_memory_mb() is None
@@ -0,0 +1,196 @@
+import copy
+import pickle
+import random
+
+import pytest
+
+from engine.bitboard import PIECE_TYPES
+from engine.move import move_from, move_to, promotion_type
+from engine.movegen import legal_moves
+from engine.position import WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE
+from engine.rules import Game, Piece
+
+
+def test_checked_king():
+    game = Game()
+    for start, end in (((1, 5), (2, 5)), ((6, 4), (4, 4)), ((1, 6), (3, 6))):
+        assert game.make_move(start, end)
+        assert game.checked_king is None
+    assert game.make_move((7, 3), (3, 7))
+    assert game.checked_king == (0, 4)
+    assert game.is_under_check()
+    assert game.outcome == 'checkmate'
+
+
+def test_no_castling_out_of_or_through_check():
+    # Out of the bishop's and the rook's check, then through f1
+    assert not Game('4k3/8/8/8/1b6/8/8/4K2R w K - 0 1').make_move((0, 4), (0, 6))
+    assert not Game('4k3/8/8/8/8/8/8/r3K2R w K - 0 1').make_move((0, 4), (0, 6))
+    assert not Game('4kr2/8/8/8/8/8/8/4K2R w K - 0 1').make_move((0, 4), (0, 6))
+    game = Game('4k3/8/8/8/8/8/8/4K2R w K - 0 1')
+    assert game.make_move((0, 4), (0, 6))
+    assert game.fen() == '4k3/8/8/8/8/8/8/5RK1 b - - 1 1'
+
+
+def test_move_into_check_is_refused():
+    game = Game('4k3/4r3/8/8/8/8/4B3/4K3 w - - 0 1')
+    assert not game.make_move((1, 4), (2, 3))
+    assert game.fen() == '4k3/4r3/8/8/8/8/4B3/4K3 w - - 0 1'
+
+
+KNIGHT_SHUFFLE = [((0, 6), (2, 5)), ((7, 6), (5, 5)), ((2, 5), (0, 6)), ((5, 5), (7, 6))]
+
+
+def test_threefold_repetition_on_the_eighth_ply():
+    game = Game()
+    for ply, (start, end) in enumerate(KNIGHT_SHUFFLE * 2, 1):
+        assert game.outcome is None
+        assert game.make_move(start, end)
+        assert game.repetitions() == ply // 4
+    assert game.outcome == 'repetition'
+    # Taking the move back takes the draw back too
+    game.unmake_move()
+    assert game.outcome is None and game.repetitions() == 1
+
+
+def test_repetitions_count_from_a_fen():
+    # The halfmove clock says nothing about the positions before the FEN
+    game = Game('4k1n1/8/8/8/8/8/8/4K1N1 w - - 40 60')
+    assert game.repetitions() == 0
+    for start, end in KNIGHT_SHUFFLE:
+        assert game.make_move(start, end)
+    assert game.repetitions() == 1 and game.outcome is None
+
+
+def test_repetition_needs_the_same_castling_rights():
+    # The rooks go out and back, but the rights they had are gone
+    game = Game('r3k3/8/8/8/8/8/8/R3K3 w Qq - 0 1')
+    for start, end in [((0, 0), (1, 0)), ((7, 0), (6, 0)), ((1, 0), (0, 0)), ((6, 0), (7, 0))] * 2:
+        assert game.make_move(start, end)
+    assert game.repetitions() == 1 and game.outcome is None
+
+
+def test_halfmove_clock():
+    game = Game('4k3/8/3p4/8/8/2N5/8/4K3 w - - 7 30')
+    assert game.halfmove == 7
+    assert game.make_move((2, 2), (3, 4))
+    assert game.halfmove == 8
+    assert game.make_move((7, 4), (7, 3))
+    assert game.halfmove == 9
+    # A capture resets it
+    assert game.make_move((3, 4), (5, 3))
+    assert game.halfmove == 0
+    assert game.make_move((7, 3), (6, 3))
+    assert game.make_move((0, 4), (1, 4))
+    assert game.halfmove == 2
+    game.unmake_move()
+    assert game.halfmove == 1
+    assert game.fen() == '8/3k4/3N4/8/8/8/8/4K3 w - - 1 32'
+
+
+def test_fifty_move_rule():
+    game = Game('4k3/8/8/8/8/8/8/4K2R w - - 99 80')
+    assert game.outcome is None
+    assert game.make_move((0, 7), (1, 7))
+    assert game.halfmove == 100 and game.outcome == 'fifty-move'
+    # A pawn move on the hundredth ply plays on
+    game = Game('4k3/8/8/8/8/8/P7/4K3 w - - 99 80')
+    assert game.make_move((1, 0), (2, 0))
+    assert game.outcome is None
+
+
+def test_checkmate_beats_the_fifty_move_rule():
+    game = Game('7k/8/6K1/8/8/8/8/R7 w - - 99 80')
+    assert game.make_move((0, 0), (7, 0))
+    assert game.outcome == 'checkmate'
+
+
+def test_castling_rights_lost_when_a_rook_moves():
+    game = Game('r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1')
+    assert game.castling == WHITE_KINGSIDE | WHITE_QUEENSIDE | BLACK_KINGSIDE | BLACK_QUEENSIDE
+    assert game.make_move((0, 7), (0, 6))
+    assert game.castling == WHITE_QUEENSIDE | BLACK_KINGSIDE | BLACK_QUEENSIDE
+    # A king move ends both of its rights
+    assert game.make_move((7, 4), (6, 4))
+    assert game.castling == WHITE_QUEENSIDE
+    # Back on their squares the rook and king still cannot castle
+    assert game.make_move((0, 6), (0, 7))
+    assert game.make_move((6, 4), (7, 4))
+    assert game.castling == WHITE_QUEENSIDE
+    assert not game.make_move((0, 4), (0, 6))
+    assert game.make_move((0, 4), (0, 2))
+    assert game.fen() == 'r3k2r/8/8/8/8/8/8/2KR3R b - - 5 3'
+    game.unmake_move()
+    assert game.castling == WHITE_QUEENSIDE
+
+
+def test_castling_right_lost_when_the_rook_is_taken():
+    game = Game('r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1')
+    assert game.make_move((0, 0), (7, 0))
+    assert game.castling == WHITE_KINGSIDE | BLACK_KINGSIDE
+    assert game.fen() == 'R3k2r/8/8/8/8/8/8/4K2R b Kk - 0 1'
+    game.unmake_move()
+    assert game.castling == WHITE_KINGSIDE | WHITE_QUEENSIDE | BLACK_KINGSIDE | BLACK_QUEENSIDE
+
+
+def test_castling_rights_need_the_pieces_at_home():
+    assert Game('4k3/8/8/8/8/8/8/4K3 w KQkq - 0 1').castling == 0
+    assert Game().castling == 15
+
+
+def test_en_passant_lasts_one_move():
+    game = Game('4k3/3p4/8/4P3/8/8/8/4K3 b - - 0 1')
+    assert game.make_move((6, 3), (4, 3))
+    assert game.ep_square == 43 and game.fen().split()[3] == 'd6'
+    game.make_move((0, 4), (1, 4))
+    game.make_move((7, 4), (7, 3))
+    assert game.ep_square is None
+    # Gone by now, even with the pawns still side by side
+    assert not game.make_move((4, 4), (5, 3))
+
+    game = Game('4k3/3p4/8/4P3/8/8/8/4K3 b - - 0 1')
+    game.make_move((6, 3), (4, 3))
+    assert game.legal_destinations((4, 4)) == {(5, 3), (5, 4)}
+    assert game.make_move((4, 4), (5, 3))
+    assert game.board[4][3] is None and game.black_captured == [Piece('BLACK', 'P')]
+    game.unmake_move()
+    assert game.board[4][3] == Piece('BLACK', 'P') and game.ep_square == 43
+
+
+def test_piece_flyweight():
+    piece = Piece('WHITE', 'N')
+    assert Piece('WHITE', 'N') is piece
+    assert Piece('BLACK', 'N') is not piece
+    assert piece.code == 1 and Piece('BLACK', 'K').code == 11
+    assert copy.copy(piece) is piece
+    assert copy.deepcopy(piece) is piece
+    assert pickle.loads(pickle.dumps(piece)) is piece
+    board = Game().board
+    assert copy.deepcopy(board)[0][1] is board[0][1]
+    with pytest.raises(AttributeError):
+        piece.colour = 'BLACK'
+    with pytest.raises(AttributeError):
+        piece.moved = True
+
+
+def test_game_rules_match_the_move_generator():
+    # Replay random games and check that the list board rules accept the
+    # same moves as engine.movegen, square by square
+    rng = random.Random(24)
+    for _ in range(3):
+        game = Game()
+        while not game.outcome and len(game.moves) < 80:
+            for row in range(8):
+                for col in range(8):
+                    piece = game.board[row][col]
+                    if piece and piece.colour == game.side:
+                        accepted = {(end_row, end_col) for end_row in range(8) for end_col in range(8)
+                                    if game.is_legal_move((row, col), (end_row, end_col))}
+                        assert accepted == set(game.legal_destinations((row, col))), game.fen()
+            move = rng.choice(legal_moves(game.bitboards))
+            promoted = promotion_type(move)
+            assert game.make_move(divmod(move_from(move), 8), divmod(move_to(move), 8),
+                                  PIECE_TYPES[promoted] if promoted is not None else None)
+            position = game.position()
+            assert (game.castling, game.ep_square) == (position.castling, position.ep_square)
+            assert game.key == game.bitboards.key == position.key
@@ -0,0 +1,47 @@
+from engine.bitboard import WHITE, BLACK, BISHOP, KNIGHT, popcount
+from engine.fen import START_FEN, position_from_fen
+from engine.move import move_to_uci
+from engine.search import MATE, MAX_PLY, score_from_tt, score_to_tt, search
+
+
+class KBNKTables:
+    # Stands in for engine.tablebase.Tablebases with KBNK built, where the
+    # longest mate takes 66 plies: every KBNK position is mate in 66 for
+    # white, anything else a draw
+    def probe(self, position):
+        if popcount(position.occupied[WHITE] | position.occupied[BLACK]) > 4:
+            return None
+        if position.pieces[BISHOP] and position.pieces[KNIGHT]:
+            return (1 if position.side == WHITE else -1), 66
+        return 0, 0
+
+    def best_move(self, position):
+        return None
+
+
+def test_tt_mate_scores_beyond_max_ply():
+    score = MATE - 100
+    assert score < MATE - MAX_PLY
+    # Stored as distance from the node, read back at another ply
+    assert score_to_tt(score, 10) == MATE - 90
+    assert score_from_tt(score_to_tt(score, 10), 4) == MATE - 94
+    assert score_from_tt(score_to_tt(-score, 10), 4) == -MATE + 94
+    assert score_to_tt(500, 10) == 500
+
+
+def test_long_tablebase_mate_ends_the_search():
+    # Taking the pawn leaves KBNK, mate in 66 more plies
+    position = position_from_fen('k7/8/8/8/8/8/p7/2N1KB2 w - - 0 1')
+    result = search(position, time_limit=10, tablebases=KBNKTables())
+    assert move_to_uci(result.move) == 'c1a2'
+    assert result.score == MATE - 67
+    # The probe is seen once the capture has depth left, and a found mate
+    # stops the deepening there rather than at the time limit
+    assert result.depth == 2 and result.elapsed < 5
+
+
+def test_search_start_position():
+    position = position_from_fen(START_FEN)
+    result = search(position, time_limit=5, max_depth=3)
+    assert result.depth == 3 and result.move is not None
+    assert position.key == position_from_fen(START_FEN).key
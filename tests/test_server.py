@@ -0,0 +1,142 @@
+import asyncio
+
+from engine.server import MAX_UNREAD, GameServer, Player
+
+START = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+
+
+async def connect(port):
+    return await asyncio.open_connection('127.0.0.1', port)
+
+
+async def send(writer, text):
+    writer.write(text.encode() + b'\n')
+    await writer.drain()
+
+
+async def receive(reader):
+    line = await asyncio.wait_for(reader.readline(), 5)
+    return line.decode().rstrip('\n')
+
+
+async def paired():
+    # A running server and two connected players, white first
+    games = GameServer()
+    listener = await asyncio.start_server(games.serve, '127.0.0.1', 0)
+    port = listener.sockets[0].getsockname()[1]
+    white = await connect(port)
+    black = await connect(port)
+    await send(white[1], 'play')
+    assert await receive(white[0]) == 'wait'
+    await send(black[1], 'play')
+    assert await receive(white[0]) == f'start 1 WHITE {START}'
+    assert await receive(black[0]) == f'start 1 BLACK {START}'
+    return games, listener, white, black
+
+
+async def closed(listener, *players):
+    for reader, writer in players:
+        writer.close()
+    listener.close()
+    await listener.wait_closed()
+
+
+def run(test):
+    asyncio.run(asyncio.wait_for(test(), 10))
+
+
+def test_move_sent_to_both():
+    async def test():
+        games, listener, white, black = await paired()
+        await send(white[1], 'move e2e4')
+        fen = 'rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1'
+        assert await receive(white[0]) == f'moved e2e4 - {fen}'
+        assert await receive(black[0]) == f'moved e2e4 - {fen}'
+        await send(black[1], 'fen')
+        assert await receive(black[0]) == f'fen {fen}'
+        assert games.moves == 1
+        await closed(listener, white, black)
+    run(test)
+
+
+def test_illegal_and_out_of_turn():
+    async def test():
+        games, listener, white, black = await paired()
+        await send(black[1], 'move e7e5')
+        assert await receive(black[0]) == 'error not your turn'
+        await send(white[1], 'move e2e5')
+        assert await receive(white[0]) == 'illegal e2e5'
+        await send(white[1], 'move xyz')
+        assert await receive(white[0]) == 'illegal xyz'
+        # Neither mistake reached the other player or changed the game
+        await send(white[1], 'move g1f3')
+        assert (await receive(black[0])).startswith('moved g1f3 - ')
+        assert games.moves == 1
+        await closed(listener, white, black)
+    run(test)
+
+
+def test_resign():
+    async def test():
+        games, listener, white, black = await paired()
+        await send(black[1], 'resign')
+        assert await receive(white[0]) == 'over 1 WHITE resign'
+        assert await receive(black[0]) == 'over 1 WHITE resign'
+        assert games.tables == {}
+        await send(white[1], 'move e2e4')
+        assert await receive(white[0]) == 'error not playing'
+        await closed(listener, white, black)
+    run(test)
+
+
+def test_disconnect():
+    async def test():
+        games, listener, white, black = await paired()
+        white[1].close()
+        assert await receive(black[0]) == 'over 1 BLACK abandoned'
+        assert games.tables == {}
+        await closed(listener, black)
+    run(test)
+
+
+class Transport:
+    def __init__(self):
+        self.buffered = 0
+        self.aborted = False
+
+    def get_write_buffer_size(self):
+        return self.buffered
+
+    def abort(self):
+        self.aborted = True
+
+
+class Writer:
+    # Collects what the server sends, with a transport whose unread bytes
+    # the test sets
+    def __init__(self):
+        self.lines = []
+        self.transport = Transport()
+
+    def write(self, data):
+        self.lines.append(data.decode().rstrip('\n'))
+        self.transport.buffered += len(data)
+
+
+def test_slow_reader_dropped():
+    # A player who stops reading is cut off once its unread output passes
+    # the limit, and leaving then gives the game to the opponent
+    games = GameServer()
+    white = Player(Writer())
+    black = Player(Writer())
+    games.play(white)
+    games.play(black)
+    white.writer.transport.buffered = 0
+    black_writer = black.writer
+    black_writer.transport.buffered = MAX_UNREAD
+    games.move(white, 'e2e4')
+    assert black_writer.transport.aborted and black.writer is None
+    assert not white.writer.transport.aborted
+    games.leave(black)
+    assert white.writer.lines[-1] == 'over 1 WHITE abandoned'
+    assert games.tables == {}
@@ -0,0 +1,39 @@
+import os
+
+import pytest
+
+from engine.fen import position_from_fen
+from engine.tablebase import Tablebases, generate, promotion_tables
+
+
+def test_promotion_tables():
+    assert promotion_tables('KPK') == ['KQK', 'KRK']
+    assert promotion_tables('KBNK') == []
+
+
+def test_kpk_builds_its_promotion_tables(tmp_path):
+    directory = str(tmp_path)
+    generate('KPK', directory, workers=2)
+    assert sorted(os.listdir(directory)) == ['KPK.tb', 'KQK.tb', 'KRK.tb']
+
+    tablebases = Tablebases(directory)
+    try:
+        # The king in front of its pawn with the opposition wins
+        wdl, plies = tablebases.probe(position_from_fen('4k3/8/4K3/4P3/8/8/8/8 w - - 0 1'))
+        assert wdl == 1 and plies > 0
+        # Pushing the pawn to the seventh too soon is stalemate
+        assert tablebases.probe(position_from_fen('4k3/4P3/4K3/8/8/8/8/8 b - - 0 1')) == (0, 0)
+        # Black's pawn wins just the same, the board is mirrored
+        wdl, _ = tablebases.probe(position_from_fen('8/8/8/8/4p3/4k3/8/4K3 b - - 0 1'))
+        assert wdl == 1
+    finally:
+        tablebases.close()
+
+
+def test_missing_promotion_table_is_an_error(tmp_path, monkeypatch):
+    # Were the promotion tables not made first, the build has to fail
+    # rather than call every promotion a draw
+    monkeypatch.setattr('engine.tablebase.promotion_tables', lambda name: [])
+    with pytest.raises(FileNotFoundError):
+        generate('KPK', str(tmp_path), workers=1)
+    assert not os.path.exists(tmp_path / 'KPK.tb')
@@ -0,0 +1,72 @@
+from engine.parallel import ParallelSearch
+from engine.tt import (BUCKET_BYTES, EXACT, LOWER, UPPER, TranspositionTable,
+                       bucket_count)
+
+
+def test_bucket_count():
+    assert bucket_count(1) * BUCKET_BYTES == 1024 * 1024
+    assert bucket_count(3) == bucket_count(2)
+    assert bucket_count(0) == 1
+
+
+def test_shared_table_size():
+    # The parallel search's shared table holds as many entries as a
+    # private table of the same size
+    parallel = ParallelSearch(1, 2)
+    try:
+        shared = TranspositionTable(buffer=parallel.memory.buf)
+        assert len(shared) == len(TranspositionTable(2))
+        del shared
+    finally:
+        parallel.close()
+
+
+def test_deeper_entry_kept():
+    # A shallower result for another key in the same bucket goes to the
+    # second slot and leaves the deeper one in place
+    table = TranspositionTable(1)
+    buckets = table.mask + 1
+    deep, shallow = 5, 5 + buckets
+    table.store(deep, 8, 100, EXACT, 12)
+    table.store(shallow, 2, -50, LOWER, 34)
+    assert table.probe(deep) == (12, 100, 8, EXACT)
+    assert table.probe(shallow) == (34, -50, 2, LOWER)
+    # A third shallow store replaces the second slot, never the first
+    table.store(5 + 2 * buckets, 1, 7, UPPER, 56)
+    assert table.probe(deep) == (12, 100, 8, EXACT)
+    assert table.probe(shallow) is None
+    assert table.probe(5 + 2 * buckets) == (56, 7, 1, UPPER)
+
+
+def test_older_search_replaced():
+    # Once a new search starts the first slot no longer prefers depth
+    table = TranspositionTable(1)
+    buckets = table.mask + 1
+    table.store(3, 8, 100, EXACT, 12)
+    table.new_search()
+    table.store(3 + buckets, 1, 0, EXACT, 34)
+    assert table.probe(3 + buckets) == (34, 0, 1, EXACT)
+    assert table.probe(3) == (12, 100, 8, EXACT)
+
+
+def test_torn_entry_rejected():
+    # An entry whose xor'ed key no longer matches its data is not returned
+    table = TranspositionTable(1)
+    key = 0x123456789ABCDEF
+    table.store(key, 4, 20, EXACT, 99)
+    index = (key & table.mask) << 2
+    assert table.probe(key) is not None
+    table.table[index + 1] ^= 1 << 16
+    assert table.probe(key) is None
+
+
+def test_occupancy_whole_table():
+    # Entries stored anywhere in the table count towards the occupancy
+    table = TranspositionTable(1)
+    buckets = table.mask + 1
+    for key in range(buckets // 2, buckets):
+        table.store(key, 1, 0, EXACT, 1)
+    occupancy = table.stats()['occupancy']
+    assert 0.2 < occupancy < 0.3
+    table.new_search()
+    assert table.stats()['occupancy'] == 0.0